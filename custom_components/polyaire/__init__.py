@@ -2,19 +2,74 @@ from __future__ import annotations
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.typing import ConfigType
 from homeassistant.const import CONF_HOST
+import homeassistant.helpers.config_validation as cv
 
+import voluptuous as vol
 import asyncio
 
-from .const import DOMAIN
+from .const import (
+    DOMAIN,
+    DATA_HANDOFF,
+    STORAGE_VERSION,
+    STORAGE_KEY,
+    SNAPSHOT_SAVE_DELAY,
+    SERVICE_SET_ZONES,
+    SERVICE_START_CAPTURE,
+    SERVICE_STOP_CAPTURE,
+    ATTR_ENTRY_ID,
+    ATTR_ZONES,
+    ATTR_ZONE,
+    ATTR_POWER,
+    ATTR_CONTROL,
+    ATTR_OPEN_PERCENTAGE,
+    ATTR_TARGET_TEMPERATURE,
+    ATTR_FILENAME,
+    DEFAULT_CAPTURE_FILENAME,
+)
 from .airtouch4 import AirTouch4
+from .capture import Capture
+from .protocol import GROUP_CONTROL_TYPES, GROUP_TARGET_TYPES, PRESETS
 
 import logging
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.CLIMATE, Platform.FAN, Platform.BINARY_SENSOR]
+PLATFORMS: list[Platform] = [Platform.CLIMATE, Platform.FAN, Platform.BINARY_SENSOR, Platform.SENSOR]
+
+ZONE_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_ZONE): cv.positive_int,
+        vol.Optional(ATTR_POWER): cv.boolean,
+        vol.Optional(ATTR_CONTROL): vol.In([PRESETS.DAMPER, PRESETS.ITC]),
+        vol.Exclusive(ATTR_OPEN_PERCENTAGE, "target"): vol.All(vol.Coerce(int), vol.Range(min=0, max=100)),
+        vol.Exclusive(ATTR_TARGET_TEMPERATURE, "target"): vol.All(vol.Coerce(int), vol.Range(min=0, max=63)),
+    }
+)
+
+SET_ZONES_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTRY_ID): cv.string,
+        vol.Required(ATTR_ZONES): vol.All(cv.ensure_list, [ZONE_SCHEMA]),
+    }
+)
+
+START_CAPTURE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTRY_ID): cv.string,
+        # a file name in the config folder, not a path
+        vol.Optional(ATTR_FILENAME, default=DEFAULT_CAPTURE_FILENAME): vol.All(cv.string, vol.Match(r"^[\w.-]+$")),
+    }
+)
+
+STOP_CAPTURE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_ENTRY_ID): cv.string,
+    }
+)
 
 async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     """Set up the Airtouch 4 component."""
@@ -24,21 +79,103 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     _LOGGER.debug("async_setup: set default domain " + DOMAIN)
     hass.data.setdefault(DOMAIN, {})
 
+    def get_airtouch(call: ServiceCall) -> AirTouch4:
+        airtouches = hass.data[DOMAIN]
+        entry_id = call.data.get(ATTR_ENTRY_ID)
+        if entry_id is None and len(airtouches) == 1:
+            entry_id = next(iter(airtouches))
+        if entry_id not in airtouches:
+            raise HomeAssistantError("Select the AirTouch to control with " + ATTR_ENTRY_ID)
+        return airtouches[entry_id]
+
+    async def async_set_zones(call: ServiceCall) -> None:
+        """Apply a whole zone scene with a single group control frame."""
+        airtouch = get_airtouch(call)
+        controls = []
+        for zone in call.data[ATTR_ZONES]:
+            control = {"group_number": zone[ATTR_ZONE]}
+            if ATTR_POWER in zone:
+                control["power"] = int(zone[ATTR_POWER])
+            if ATTR_CONTROL in zone:
+                control["control_type"] = GROUP_CONTROL_TYPES.DAMPER if zone[ATTR_CONTROL] == PRESETS.DAMPER else GROUP_CONTROL_TYPES.TEMPERATURE
+            if ATTR_OPEN_PERCENTAGE in zone:
+                control["target_type"] = GROUP_TARGET_TYPES.DAMPER
+                control["target"] = zone[ATTR_OPEN_PERCENTAGE]
+            elif ATTR_TARGET_TEMPERATURE in zone:
+                control["target_type"] = GROUP_TARGET_TYPES.TEMPERATURE
+                control["target"] = zone[ATTR_TARGET_TEMPERATURE]
+            controls.append(control)
+        _LOGGER.debug("async_set_zones: applying " + str(controls))
+        if not airtouch.connected:
+            raise HomeAssistantError("AirTouch is not connected")
+        try:
+            await airtouch.request_groups(controls)
+        except asyncio.TimeoutError as err:
+            raise HomeAssistantError("AirTouch did not answer the command") from err
+
+    async def async_start_capture(call: ServiceCall) -> None:
+        """Write the raw AirTouch traffic to a capture file in the config folder, for tools/replay.py."""
+        airtouch = get_airtouch(call)
+        path = hass.config.path(call.data[ATTR_FILENAME])
+        try:
+            capture = await hass.async_add_executor_job(Capture, path)
+        except OSError as err:
+            raise HomeAssistantError("Cannot create the capture file " + path + ": " + str(err)) from err
+        await airtouch.start_capture(capture)
+
+    async def async_stop_capture(call: ServiceCall) -> None:
+        """Stop the capture and write the rest of it."""
+        await get_airtouch(call).stop_capture()
+
+    hass.services.async_register(DOMAIN, SERVICE_SET_ZONES, async_set_zones, schema=SET_ZONES_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_START_CAPTURE, async_start_capture, schema=START_CAPTURE_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_STOP_CAPTURE, async_stop_capture, schema=STOP_CAPTURE_SCHEMA)
+
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Airtouch4 from a config entry."""
     # Store an instance of the "connecting" class that does the work of speaking
     # with your actual devices.
-    _LOGGER.debug("async_setup_entry: create airtouch hub for host " + entry.data[CONF_HOST])
-    airtouch = AirTouch4(entry.data[CONF_HOST])
-    try:
-        _LOGGER.debug("async_setup_entry: waiting for airtouch connection to be ready...")
-        await asyncio.wait_for(airtouch.ready(), 20)
-    except asyncio.TimeoutError:
-        _LOGGER.debug("async_setup_entry: timeout error waiting for airtouch, disconnecting...")
-        await airtouch.disconnect()
-        return False
+    airtouch = hass.data.get(DATA_HANDOFF, {}).pop(entry.data[CONF_HOST], None)
+    if airtouch:
+        # the config flow already verified this connection and started the handshake
+        _LOGGER.debug("async_setup_entry: taking over airtouch hub from the config flow for host " + entry.data[CONF_HOST])
+    else:
+        _LOGGER.debug("async_setup_entry: create airtouch hub for host " + entry.data[CONF_HOST])
+        airtouch = AirTouch4(entry.data[CONF_HOST])
+    store = _snapshot_store(hass, entry)
+    snapshot = await store.async_load()
+    if snapshot and airtouch.restore(snapshot):
+        # entities are created from the stored snapshot, live data refreshes them in the background
+        _LOGGER.debug("async_setup_entry: restored airtouch snapshot, refreshing in the background...")
+    else:
+        try:
+            _LOGGER.debug("async_setup_entry: waiting for airtouch connection to be ready...")
+            await asyncio.wait_for(airtouch.ready(), 20)
+        except asyncio.TimeoutError:
+            _LOGGER.debug("async_setup_entry: timeout error waiting for airtouch, disconnecting...")
+            await airtouch.disconnect()
+            return False
+        await store.async_save(airtouch.snapshot())
+
+    # every delayed save call restarts its timer, which would never fire while zone temperatures
+    # change more often: only the first change after a write schedules the next one
+    save_pending = False
+
+    def write_snapshot() -> dict:
+        nonlocal save_pending
+        save_pending = False
+        return airtouch.snapshot()
+
+    def save_snapshot() -> None:
+        nonlocal save_pending
+        if not save_pending:
+            save_pending = True
+            store.async_delay_save(write_snapshot, SNAPSHOT_SAVE_DELAY)
+
+    for record in [*airtouch.groups.values(), *airtouch.acs.values()]:
+        record.register_callback(save_snapshot)
 
     hass.data[DOMAIN][entry.entry_id] = airtouch
 
@@ -71,9 +208,17 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok:
         _LOGGER.debug("async_unload_entry: unload successful, now waiting for airtouch to disconnect...")
         airtouch = hass.data[DOMAIN].pop(entry.entry_id)
+        await _snapshot_store(hass, entry).async_save(airtouch.snapshot())
         await airtouch.disconnect()
     else:
         _LOGGER.debug("async_unload_entry: unload was not successful")
 
     _LOGGER.debug("async_unload_entry: exiting")
     return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the stored snapshot of a deleted config entry."""
+    await _snapshot_store(hass, entry).async_remove()
+
+def _snapshot_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    return Store(hass, STORAGE_VERSION, STORAGE_KEY + "." + entry.entry_id)
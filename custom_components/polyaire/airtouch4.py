@@ -1,249 +1,917 @@
 from __future__ import annotations
+from typing import Any
 
 import asyncio
+import bisect
+import math
+import random
 import socket
+import time
 
+from .capture import Capture, CAPTURE_RECEIVED, CAPTURE_SENT
+from .metrics import Metrics
 from .protocol import *
+from .send_queue import SendQueue
 
 import logging
 _LOGGER = logging.getLogger(__name__)
 
+# seconds to wait for the status reply to a request
+REQUEST_TIMEOUT = 5
+# seconds a commanded value is shown before a status frame confirms it, rolled back after that
+OPTIMISTIC_TIMEOUT = 10
+# damper positions are set in steps of 5%
+DAMPER_STEP = 5
+# seconds between group status polls while the console does not push group updates
+DEFAULT_POLL_INTERVAL = 30
+# unsolicited group status frames seen before the console is trusted to push group updates
+PUSHES_TO_DISABLE_WORKAROUND = 2
+# seconds a reply to a completed request may still arrive, e.g. for both copies of a retransmitted one
+LATE_REPLY_WINDOW = REQUEST_TIMEOUT
+# seconds without a valid frame before a heartbeat is sent, and before the link is considered dead
+DEFAULT_HEARTBEAT_INTERVAL = 20
+DEFAULT_DEAD_LINK_TIMEOUT = 60
+# seconds to wait between connection attempts, doubled after every failed attempt
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# TCP keepalive: idle seconds before the first probe, seconds between probes, probes before the socket fails
+TCP_KEEPALIVE_IDLE = 20
+TCP_KEEPALIVE_INTERVAL = 5
+TCP_KEEPALIVE_COUNT = 3
+# most frames written to the socket at once, the rest of the queue goes out with the next write
+SEND_BATCH_MAX_FRAMES = 16
+# token bucket: frames per second, and frames that can be sent at once after an idle period
+DEFAULT_PACING_RATE = 20
+DEFAULT_PACING_BURST = 8
+# seconds between frames after the console dropped one: the first gap, the largest gap,
+# the fraction of the gap kept after every reply, and the gap below which frames are batched again
+PACING_DROP_GAP = 0.05
+PACING_MAX_GAP = 1.0
+PACING_GAP_DECAY = 0.9
+PACING_MIN_GAP = 0.005
+# seconds without a reply before a request counts as dropped and is sent again,
+# learned from the round trip times within these bounds, a console on Wi-Fi can take over a second to answer
+PACING_INITIAL_RTO = 2.0
+PACING_MIN_RTO = 1.0
+PACING_MAX_RTO = 4.0
+
+class AirTouch4Protocol(asyncio.Protocol):
+    def __init__(self, airtouch: AirTouch4):
+        self._airtouch = airtouch
+        # the parser lives as long as the hub, so its error counters span reconnects
+        self._parser = airtouch._parser
+        self._parser.reset()
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+    def data_received(self, data: bytes) -> None:
+        received = time.monotonic()
+        self._airtouch.metrics.counters["bytes_received"] += len(data)
+        if self._airtouch._capture:
+            self._airtouch._capture.write(CAPTURE_RECEIVED, received, data)
+        for msg in self._parser.feed(data):
+            try:
+                self._airtouch._receive(msg, received)
+            except Exception:
+                _LOGGER.exception("Error handling message with type: " + hex(msg.type))
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self._can_write.set()
+        self._airtouch._connection_lost()
+
+    def pause_writing(self) -> None:
+        self._can_write.clear()
+
+    def resume_writing(self) -> None:
+        self._can_write.set()
+
+    async def drain(self) -> None:
+        await self._can_write.wait()
+
+class Dispatcher:
+    """Calls every listener of the records changed by one frame once, on its own task."""
+    def __init__(self, metrics: Metrics, maxsize: int = 16):
+        self._metrics = metrics
+        self._queue = asyncio.Queue(maxsize)
+        self._overflow = set()
+        self._overflow_received = None
+        self._task = None
+
+    def start(self) -> None:
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def dispatch(self, records: list[Updateable], received: float) -> None:
+        """Queue the callbacks of the records, received is the monotonic time the frame arrived."""
+        callbacks = set()
+        for record in records:
+            callbacks.update(record.callbacks)
+        if not callbacks:
+            return
+        try:
+            self._queue.put_nowait((callbacks, received))
+        except asyncio.QueueFull:
+            # listeners only read the latest state, merge into the next batch
+            self._overflow.update(callbacks)
+            if self._overflow_received is None:
+                self._overflow_received = received
+
+    async def _run(self) -> None:
+        while True:
+            callbacks, received = await self._queue.get()
+            if self._overflow:
+                callbacks.update(self._overflow)
+                received = min(received, self._overflow_received)
+                self._overflow = set()
+                self._overflow_received = None
+            for callback in callbacks:
+                _LOGGER.debug("Status updated, calling: " + str(callback))
+                try:
+                    callback()
+                except Exception:
+                    _LOGGER.exception("Error in status update callback: " + str(callback))
+            self._metrics.dispatch_time.observe(time.monotonic() - received)
+
+class StatusScheduler:
+    """Keeps at most one group status request in flight, and polls only while group updates are not pushed."""
+    def __init__(self, airtouch: AirTouch4, poll_interval: float = DEFAULT_POLL_INTERVAL):
+        self._airtouch = airtouch
+        self.poll_interval = poll_interval
+        # some consoles only send group status when asked, request it after every AC status frame
+        # until the console is seen pushing group updates by itself
+        self.workaround = True
+        self._pushes = 0
+        self._in_flight = None
+        self._last_push = None
+        self._task = None
+
+    def start(self) -> None:
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def request_group_status(self) -> asyncio.Future:
+        if self._in_flight and not self._in_flight.done():
+            self._airtouch.metrics.counters["group_status_suppressed"] += 1
+            return self._in_flight
+        self._in_flight = self._airtouch._request(Message.GROUP_STATUS_REQUEST())
+        return self._in_flight
+
+    def ac_status_received(self) -> None:
+        if self.workaround:
+            self.request_group_status()
+
+    def group_status_received(self, solicited: bool) -> None:
+        if solicited:
+            return
+        self._airtouch.metrics.counters["group_status_pushed"] += 1
+        self._last_push = time.monotonic()
+        self._pushes += 1
+        if self.workaround and self._pushes >= PUSHES_TO_DISABLE_WORKAROUND:
+            _LOGGER.info("AirTouch pushes group status updates, disabling group status workaround")
+            self.workaround = False
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if self._last_push is None or time.monotonic() - self._last_push > self.poll_interval:
+                _LOGGER.debug("No group status pushed recently, polling...")
+                if not self.workaround:
+                    _LOGGER.info("AirTouch stopped pushing group status updates, enabling group status workaround")
+                    self.workaround = True
+                self._pushes = 0
+                self._airtouch.metrics.counters["group_status_polled"] += 1
+                self.request_group_status()
+
+class Watchdog:
+    """Sends heartbeats on an idle link and forces a reconnect when no valid frame arrives in time."""
+    def __init__(self, airtouch: AirTouch4, heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL, dead_link_timeout: float = DEFAULT_DEAD_LINK_TIMEOUT):
+        self._airtouch = airtouch
+        self.heartbeat_interval = heartbeat_interval
+        self.dead_link_timeout = dead_link_timeout
+        self.last_frame = time.monotonic()
+        self._last_heartbeat = 0
+        self._task = None
+
+    def start(self) -> None:
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def frame_received(self) -> None:
+        self.last_frame = time.monotonic()
+
+    async def _run(self) -> None:
+        check_interval = min(self.heartbeat_interval, self.dead_link_timeout) / 4
+        while True:
+            await asyncio.sleep(check_interval)
+            if not self._airtouch.connected:
+                continue
+            idle = time.monotonic() - self.last_frame
+            if idle > self.dead_link_timeout:
+                _LOGGER.error("No message received from AirTouch for " + str(int(idle)) + "s, reconnecting...")
+                self._airtouch.metrics.counters["dead_links"] += 1
+                self._airtouch.metrics.gauges["last_dead_link_detection"] = idle
+                self._airtouch._abort()
+            elif idle > self.heartbeat_interval and time.monotonic() - self._last_heartbeat > self.heartbeat_interval:
+                self._last_heartbeat = time.monotonic()
+                _LOGGER.debug("AirTouch link idle for " + str(int(idle)) + "s, sending heartbeat...")
+                self._airtouch.metrics.counters["heartbeats"] += 1
+                self._airtouch._request(Message.AC_STATUS_REQUEST())
+
+class Pacer:
+    """Token bucket rate limit, with an inter-frame gap learned from the console's replies.
+
+    While the console answers everything the gap is 0 and queued frames go out together,
+    as many as there are tokens. Round trip times give a retransmission timeout, like TCP's:
+    a request not answered within it counts as dropped and is sent again, and the timeout
+    is doubled until a request is answered without being sent again. A drop doubles
+    the gap, to at least the smoothed round trip time, and frames are then written one at
+    a time that far apart. Every reply shrinks the gap by PACING_GAP_DECAY, until it is
+    below PACING_MIN_GAP and frames are batched again.
+    """
+    def __init__(self, metrics: Metrics, rate: float = DEFAULT_PACING_RATE, burst: int = DEFAULT_PACING_BURST):
+        self._metrics = metrics
+        self.rate = rate
+        self.burst = burst
+        self.gap = 0.0
+        self.srtt = None
+        self.rttvar = None
+        self.rto = PACING_INITIAL_RTO
+        self._tokens = burst
+        self._refilled = time.monotonic()
+        self._last_write = 0.0
+        # monotonic time the gap was last increased
+        self._increased = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    async def wait(self) -> int:
+        """Wait until the next write is allowed, returns the most frames it may carry."""
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(self._last_write + self.gap - now, (1 - self._tokens) / self.rate)
+            if delay <= 0:
+                return 1 if self.gap else int(self._tokens)
+            await asyncio.sleep(delay)
+
+    def sent(self, count: int) -> None:
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= count
+        self._last_write = now
+        self._metrics.frames_written(count, now)
+
+    def replied(self, round_trip_time: float | None) -> None:
+        """A request was answered, round_trip_time is None when it was sent more than once."""
+        gauges = self._metrics.gauges
+        if self.gap:
+            self.gap = self.gap * PACING_GAP_DECAY if self.gap * PACING_GAP_DECAY >= PACING_MIN_GAP else 0.0
+            gauges["pacing_gap"] = self.gap
+        # Karn's rule: the reply to a retransmitted request may answer any of its copies
+        if round_trip_time is None:
+            return
+        # RFC 6298 estimators
+        if self.srtt is None:
+            self.srtt = round_trip_time
+            self.rttvar = round_trip_time / 2
+        else:
+            self.rttvar += (abs(self.srtt - round_trip_time) - self.rttvar) / 4
+            self.srtt += (round_trip_time - self.srtt) / 8
+        self.rto = min(PACING_MAX_RTO, max(PACING_MIN_RTO, self.srtt + 4 * self.rttvar))
+        gauges["smoothed_round_trip_time"] = self.srtt
+        gauges["retransmission_timeout"] = self.rto
+
+    def dropped(self, sent: float) -> None:
+        """A frame written at monotonic time sent was dropped."""
+        # frames written before the last increase were paced by the old gap, one increase covers them
+        if sent < self._increased:
+            return
+        self._increased = time.monotonic()
+        # a console slower than the timeout looks like a dropping one, back off until a clean sample
+        self.rto = min(PACING_MAX_RTO, 2 * self.rto)
+        self._metrics.gauges["retransmission_timeout"] = self.rto
+        self.gap = min(PACING_MAX_GAP, max(2 * self.gap, self.srtt or 0, PACING_DROP_GAP))
+        self._metrics.gauges["pacing_gap"] = self.gap
+        _LOGGER.info("AirTouch dropped a message, sending one frame every " + str(round(self.gap * 1000)) + "ms")
+
 class AirTouch4():
-    def __init__(self, host, port=9004):
+    def __init__(self, host, port=9004, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL, dead_link_timeout: float = DEFAULT_DEAD_LINK_TIMEOUT,
+                 capture_path: str = None, tcp_nodelay: bool = True,
+                 pacing_rate: float = DEFAULT_PACING_RATE, pacing_burst: int = DEFAULT_PACING_BURST):
         self._host = host
         self._port = port
+        # with the frames batched into one write, Nagle's algorithm only delays them
+        self._tcp_nodelay = tcp_nodelay
         self.want_connection = True
         self.connected = False
-        self.groups = []
+        self.groups: dict[int, AirTouchGroupStatus] = {}
         self.groups_info = {}
         self._groups_ready = asyncio.Event()
-        self.acs = []
+        self.acs: dict[int, AirTouchACStatus] = {}
         self.acs_info = {}
         self._acs_ready = asyncio.Event()
-        self._reader = None
-        self._receiver = None
-        self._writer = None
-        self._sender = None
-        self._queue = asyncio.Queue()
+        # error description by AC, requested with request_ac_error_info() by the diagnostics
+        self.acs_error_info: dict[int, str] = {}
+        self._handshake = None
+        self._group_acs: dict[int, int] = {}
+        self._ac_groups: dict[int, list[AirTouchGroupStatus]] = {}
+        self._transport = None
+        self._protocol = None
+        self._connected = asyncio.Event()
+        self._connector = None
+        self._disconnected_at = None
+        self._parser = FrameParser()
+        self._builder = FrameBuilder()
+        self.metrics = Metrics(self._parser)
+        self._queue = SendQueue(self.metrics)
+        self._pacer = Pacer(self.metrics, pacing_rate, pacing_burst)
+        self._dispatcher = Dispatcher(self.metrics)
+        # opens the file right away, Home Assistant starts captures with the start_capture service
+        self._capture = Capture(capture_path) if capture_path else None
+        self._scheduler = StatusScheduler(self, poll_interval)
+        self._watchdog = Watchdog(self, heartbeat_interval, dead_link_timeout)
+        self._last_frames: dict[int, bytes] = {}
+        self._pending: dict[tuple[int, int], tuple[asyncio.Future, Message]] = {}
+        # monotonic time requests were completed, by (id, reply type), to recognise late replies
+        self._completed: dict[tuple[int, int], float] = {}
+        # status message types still to be checked against a restored snapshot
+        self._verify: set[int] = set()
+        self._dispatcher.start()
+        self._scheduler.start()
+        self._watchdog.start()
+        self._sender = asyncio.create_task(self._send())
         _LOGGER.debug("created new airtouch hub, waiting to connect to the host...")
-        asyncio.create_task(self._connect())
-
-    def get_group_ac(self, group_number: int) -> int:
-        ac_unit_number = 0
-        ac_group_start = 0
-        for unit_number, info in self.acs_info.items():
-            if info["ac_group_start"] <= group_number and info["ac_group_start"] > ac_group_start:
-                ac_unit_number = unit_number
-                ac_group_start = info["ac_group_start"]
-        return self.acs[ac_unit_number]
-
-    def get_ac_groups(self, unit_number: int) -> list[int]:
-        ac_group_start = self.acs_info[unit_number]["ac_group_start"]
-        ac_group_end = len(self.groups)
-        for unit_number, info in self.acs_info.items():
-            if info["ac_group_start"] > ac_group_start and info["ac_group_start"] < ac_group_end:
-                ac_group_end = info["ac_group_start"]
-        return [group for group in self.groups if group.group_number in range(ac_group_start, ac_group_end)]
+        self._reconnect()
+
+    def get_group(self, group_number: int) -> AirTouchGroupStatus:
+        return self.groups.get(group_number)
+
+    def get_group_ac(self, group_number: int) -> AirTouchACStatus:
+        return self.acs.get(self._group_acs.get(group_number, 0))
+
+    def get_ac_groups(self, unit_number: int) -> list[AirTouchGroupStatus]:
+        return self._ac_groups.get(unit_number, [])
+
+    def _index_groups(self) -> None:
+        # interval index: each AC owns the groups from its ac_group_start up to the next AC's start
+        starts = sorted((info["ac_group_start"], unit_number) for unit_number, info in self.acs_info.items())
+        self._group_acs = {}
+        self._ac_groups = {unit_number: [] for _, unit_number in starts}
+        for group_number in sorted(self.groups):
+            index = bisect.bisect_right(starts, (group_number, math.inf)) - 1
+            # groups before the first AC start belong to AC 0
+            unit_number = starts[index][1] if index >= 0 else 0
+            self._group_acs[group_number] = unit_number
+            if unit_number in self._ac_groups:
+                self._ac_groups[unit_number].append(self.groups[group_number])
 
+    def _reconnect(self) -> None:
+        # never run two connection attempts at once
+        if self.want_connection and (not self._connector or self._connector.done()):
+            self._connector = asyncio.create_task(self._connect())
 
     async def _connect(self) -> None:
+        loop = asyncio.get_running_loop()
+        attempt = 0
         while self.want_connection and not self.connected:
             _LOGGER.info("(Re)connecting...")
             try:
                 _LOGGER.debug("open socket connection to the airtouch...")
-                task = asyncio.open_connection(self._host, self._port)
-                self._reader, self._writer = await asyncio.wait_for(task, 10)
-            except socket.gaierror:
-                _LOGGER.error("Cannot find AirTouch host, giving up...")
-                return
-            except asyncio.TimeoutError:
-                _LOGGER.error("Cannot connect to AirTouch host, giving up...")
-                return
-            except Exception:
-                # try again on disconnect
-                _LOGGER.warning("Error connecting to AirTouch host, trying again in 5s...")
-                self.connected = False
-                await asyncio.sleep(5)
+                task = loop.create_connection(lambda: AirTouch4Protocol(self), self._host, self._port)
+                self._transport, self._protocol = await asyncio.wait_for(task, 10)
+            except Exception as e:
+                # capped exponential backoff, with jitter so several hubs do not retry in lockstep
+                delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                attempt += 1
+                if isinstance(e, socket.gaierror):
+                    _LOGGER.error("Cannot find AirTouch host, trying again in " + str(round(delay, 1)) + "s...")
+                elif isinstance(e, asyncio.TimeoutError):
+                    _LOGGER.error("Cannot connect to AirTouch host, trying again in " + str(round(delay, 1)) + "s...")
+                else:
+                    _LOGGER.warning("Error connecting to AirTouch host, trying again in " + str(round(delay, 1)) + "s...")
+                await asyncio.sleep(delay)
                 continue
             self.connected = True
+            self._connected.set()
+            self._watchdog.frame_received()
+            self._set_socket_options()
             _LOGGER.info("(Re)connected!")
-        if not self.want_connection:
+            if self._disconnected_at is not None:
+                self.metrics.counters["reconnects"] += 1
+                self.metrics.gauges["last_reconnect_duration"] = time.monotonic() - self._disconnected_at
+                self._disconnected_at = None
+                self._resync()
+
+    def _resync(self) -> None:
+        # one status refresh after a reconnect, only the fields that changed
+        # while offline differ from the last decoded chunks and reach the callbacks
+        if self._groups_ready.is_set():
+            self._scheduler.request_group_status()
+        if self._acs_ready.is_set():
+            self._request(Message.AC_STATUS_REQUEST())
+
+    def _set_socket_options(self) -> None:
+        sock = self._transport.get_extra_info("socket")
+        if sock is None:
             return
-        # start receiver task
-        if not self._receiver or self._receiver.done():
-            self._receiver = asyncio.create_task(self._receive())
-        # start sender task
-        if not self._sender or self._sender.done():
-            self._sender = asyncio.create_task(self._send())
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self._tcp_nodelay))
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # not every platform has the tuning options
+        for option, value in (("TCP_KEEPIDLE", TCP_KEEPALIVE_IDLE),
+                              ("TCP_KEEPINTVL", TCP_KEEPALIVE_INTERVAL),
+                              ("TCP_KEEPCNT", TCP_KEEPALIVE_COUNT)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def _abort(self) -> None:
+        # drop a dead connection without waiting for buffered data, connection_lost reconnects
+        if self._transport:
+            self._transport.abort()
+
+    def _connection_lost(self) -> None:
+        self.connected = False
+        self._connected.clear()
+        self._transport = None
+        self._protocol = None
+        if self.want_connection:
+            _LOGGER.error("Connection error in receiver!")
+            _LOGGER.info("Message receiver lost connection, trying to reconnect...")
+            self._disconnected_at = time.monotonic()
+            # requests sent on the lost connection will not be answered, send them again once reconnected
+            for future, request in reversed(list(self._pending.values())):
+                if request.sent is not None and not future.done():
+                    request.sent = None
+                    self._queue.requeue(request)
+            self._reconnect()
 
     async def disconnect(self):
         _LOGGER.info("Disconnecting...")
         self.want_connection = False
+        if self._connector and not self._connector.done():
+            self._connector.cancel()
+        if self._handshake and not self._handshake.done():
+            self._handshake.cancel()
         if self.connected:
-            # close socket/writer with IncompleteReadError
-            self._writer.close()
-            await self._writer.wait_closed()
-        if self._receiver and not self._receiver.done():
-            self._receiver.cancel()
+            self._transport.close()
         if self._sender and not self._sender.done():
             self._sender.cancel()
+        self._dispatcher.stop()
+        self._scheduler.stop()
+        self._watchdog.stop()
+        await self.stop_capture()
+
+    async def start_capture(self, capture: Capture) -> None:
+        """Write all raw traffic to a capture, for tools/replay.py. Create the Capture in an executor,
+        it opens its file."""
+        await self.stop_capture()
+        self._capture = capture
+
+    async def stop_capture(self) -> None:
+        capture, self._capture = self._capture, None
+        if capture:
+            await capture.close()
     
+    async def probe(self) -> Message:
+        """Check that the host answers with a single valid frame, lighter than ready()."""
+        return await self.request_ac_status()
+
     async def ready(self) -> None:
-        # request info from AirTouch
-        if not self._groups_ready.is_set():
-            await self.request_group_info()
-            await self.request_group_status()
-        if not self._acs_ready.is_set():
-            await self.request_ac_info()
-            await self.request_ac_status()
-        # wait for status response
+        # callers (e.g. config flow and entry setup) share a single handshake
+        if not self._handshake:
+            self._handshake = asyncio.ensure_future(self._ready())
+        await asyncio.shield(self._handshake)
+
+    async def _ready(self) -> None:
+        # request whatever is still missing from AirTouch, all at once
+        if not self.groups_info:
+            self._request(Message.GROUP_EXTENDED_REQUEST())
+        if not self.groups:
+            self._scheduler.request_group_status()
+        if not self.acs_info:
+            self._request(Message.AC_EXTENDED_REQUEST())
+        if not self.acs:
+            self._request(Message.AC_STATUS_REQUEST())
+        # wait for info and status responses
         await self._groups_ready.wait()
         await self._acs_ready.wait()
         _LOGGER.info("Received all status information from AirTouch, ready to go!")
 
-    async def _read_msg(self) -> Message:
-        header = await self._reader.readexactly(6)
-        if bytes(header[:2]) != HEADER_BYTES:
-            _LOGGER.error("Message received with invalid header!")
-            return None
-        unknown = False
-        extended = False
-        # if header[2:4] == bytes(reversed(EXTENDED_ADDRESS_BYTES)):
-        if header[3] == EXTENDED_ADDRESS_BYTES[0]:
-            _LOGGER.debug("Message received with extended header!")
-            extended = True
-        # elif header[2:4] != bytes(reversed(ADDRESS_BYTES)):
-        elif header[3] != ADDRESS_BYTES[0]:
-            _LOGGER.warning("Message received with unknown header: " + str(header[2:4]))
-            unknown = True
+    def _is_repeated(self, msg: Message) -> bool:
+        # status frames are mostly identical to the previous one of the same type
+        if self._last_frames.get(msg.type) == msg.data:
+            self.metrics.counters["frames_skipped"] += 1
+            return True
+        self._last_frames[msg.type] = msg.data
+        self.metrics.counters["frames_decoded"] += 1
+        return False
+
+    def _decode_status(self, data: bytes, records: dict[int, Updateable], record_type: type[Updateable], updated: list[Updateable]) -> bool:
+        # decode only the chunks that changed since the previous frame, returns True if a record was added
+        added = False
+        counters = self.metrics.counters
+        for offset in range(0, len(data), record_type.CHUNK_SIZE):
+            number = data[offset] & 0b00111111
+            existing = records.get(number)
+            if not existing:
+                records[number] = record_type.from_bytes(data, offset)
+                added = True
+            elif existing.matches(data, offset):
+                counters["chunks_skipped"] += 1
+                continue
+            elif existing.decode(data, offset):
+                updated.append(existing)
+            if existing and existing.optimistic:
+                existing.confirm_optimistic()
+            counters["chunks_decoded"] += 1
+        return added
+
+    def _request(self, msg: Message, timeout: float = REQUEST_TIMEOUT) -> asyncio.Future:
+        """Queue a request, the returned future resolves with the matching reply or times out."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (msg.id, msg.reply_type)
+        previous = self._pending.get(key)
+        if previous:
+            # message id wrapped around while the old request was still waiting
+            previous[0].cancel()
+        self._pending[key] = (future, msg)
+        timer = loop.call_later(timeout, self._request_timeout, key, future)
+        future.add_done_callback(lambda f: self._request_done(key, f, timer, msg))
+        superseded = self._queue.put_nowait(msg)
+        depth = self._queue.qsize()
+        self.metrics.gauges["send_queue_depth"] = depth
+        self.metrics.send_queue_depth.observe(depth)
+        if superseded:
+            # the replaced request is answered by the reply to the newer one
+            self.metrics.counters["commands_coalesced"] += 1
+            previous = self._pending.get((superseded.id, superseded.reply_type))
+            if previous:
+                future.add_done_callback(lambda f: self._copy_result(f, previous[0]))
+        return future
+
+    @staticmethod
+    def _copy_result(source: asyncio.Future, target: asyncio.Future) -> None:
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception():
+            target.set_exception(source.exception())
         else:
-            _LOGGER.debug("Message received with expected header!")
-
-        size_bytes = await self._reader.readexactly(2)
-        size = int.from_bytes(size_bytes, ENDIANNESS)
-        data = await self._reader.readexactly(size)
-        crc_bytes = await self._reader.readexactly(2)
-        crc = int.from_bytes(crc_bytes, ENDIANNESS)
-        if crc != crc16(header[2:] + size_bytes + data):
-            _LOGGER.error("Message received has invalid crc!")
-            return None
-        elif unknown:
-            if (size_bytes):
-                _LOGGER.warning("Unknown message:")
-                _LOGGER.warning(data)
+            target.set_result(source.result())
+
+    async def _command(self, msg: Message, unchanged: bool, record: Updateable | None = None, fields: dict[str, Any] | None = None) -> Message | None:
+        # drop commands that would not change the known state, unless an earlier
+        # command for the same field is still queued or waiting for its reply
+        if unchanged and not any(request.key == msg.key for _, request in self._pending.values()):
+            _LOGGER.debug("Dropping message with no effect on the current state: " + str(msg.key))
+            self.metrics.counters["commands_dropped"] += 1
             return None
+        if record is not None and fields:
+            self._set_optimistic(record, fields, msg.reply_type)
+        return await self._request(msg)
 
-        msg_id = header[4]
-        msg_type = header[5]
-        return Message(data, msg_type, msg_id, extended)
+    def _set_optimistic(self, record: Updateable, fields: dict[str, Any], status_type: int) -> None:
+        # show the commanded values now, the next status frame confirms them
+        now = time.monotonic()
+        if record.set_optimistic(fields, now + OPTIMISTIC_TIMEOUT):
+            self._dispatcher.dispatch([record], now)
+        # a status frame identical to the previous one still has to confirm or contradict the values
+        self._last_frames.pop(status_type, None)
+        self.metrics.counters["optimistic_updates"] += 1
+        asyncio.get_running_loop().call_later(OPTIMISTIC_TIMEOUT, self._optimistic_timeout, record)
 
-    async def _receive(self) -> None:
-        _LOGGER.info("Message receiver task (re)started...")
-        while self.connected:
-            try:
-                while msg := await self._read_msg():
-                    if msg.type == MSGTYPE_GRP_STAT:
-                        _LOGGER.debug("Message received is group message!")
-                        groups = msg.decode_groups_status()
-                        for group in groups:
-                            existing = next((g for g in self.groups if g.group_number == group), None)
-                            if not existing:
-                                self.groups.append(AirTouchGroupStatus(**groups[group].__dict__))
-                            else:
-                                existing.update(groups[group].__dict__)
-                        if len(self.groups): self._groups_ready.set()
-                    elif msg.type == MSGTYPE_AC_STAT:
-                        _LOGGER.debug("Message received is AC message!")
-                        acs = msg.decode_acs_status()
-                        for ac in acs:
-                            existing = next((u for u in self.acs if u.ac_unit_number == ac), None)
-                            if not existing:
-                                self.acs.append(AirTouchACStatus(**acs[ac].__dict__))
-                            else:
-                                existing.update(acs[ac].__dict__)
-                        if len(self.acs): self._acs_ready.set()
-                        ### workaround for group messages not being received ###
-                        ### TODO: remove this after issues is fixed by Polyaire ###
-                        await self.request_group_status()
-                    elif msg.type == MSGTYPE_EXTENDED:
-                        _LOGGER.debug("Message received is extended message!")
-                        if msg.data[:2] == MSG_EXTENDED_GROUP_DATA:
-                            self.groups_info.update(msg.decode_groups_info())
-                            _LOGGER.debug(self.groups_info)
-                        elif msg.data[:2] == MSG_EXTENDED_AC_DATA:
-                            self.acs_info.update(msg.decode_acs_info())
-                            _LOGGER.debug(self.acs_info)
-                    else:
-                        _LOGGER.debug("Message received with unknown type: " + hex(msg.type))
-                        _LOGGER.debug(msg.data)
-            except Exception: # asyncio.IncompleteReadError
-                _LOGGER.error("Connection error in receiver!")
-                self.connected = False
-                self._reader = None
-                self._writer = None
-        _LOGGER.info("Message receiver lost connection, trying to reconnect...")
-        asyncio.create_task(self._connect())
-
-    async def _write_msg(self, msg: Message) -> None:
-        size_bytes, data = msg.encode()
-        self._writer.writelines([size_bytes, data])
-        await self._writer.drain()
+    def _optimistic_timeout(self, record: Updateable) -> None:
+        expired = record.expire_optimistic(time.monotonic())
+        if not expired:
+            return
+        _LOGGER.warning("AirTouch did not confirm " + ", ".join(expired) + " of " + repr(record) + ", rolling back")
+        self.metrics.counters["optimistic_rollbacks"] += 1
+        self._dispatcher.dispatch([record], time.monotonic())
+
+    @staticmethod
+    def _group_fields(power: int | None = None, control_type: int = GROUP_CONTROL_TYPES.KEEP,
+                      target_type: int = GROUP_TARGET_TYPES.KEEP, target: int = 0, **kwargs) -> dict[str, Any]:
+        # status fields a GROUP_CONTROL_REQUEST sets, status reports 0 for damper and 1 for temperature control
+        fields = {}
+        if power is not None:
+            fields["group_power_state"] = 1 if power else 0
+        if control_type in (GROUP_CONTROL_TYPES.DAMPER, GROUP_CONTROL_TYPES.TEMPERATURE):
+            fields["group_control_type"] = control_type - GROUP_CONTROL_TYPES.DAMPER
+        if target_type == GROUP_TARGET_TYPES.DAMPER:
+            fields["group_open_perc"] = target
+        elif target_type == GROUP_TARGET_TYPES.TEMPERATURE:
+            fields["group_target"] = target
+        return fields
+
+    @staticmethod
+    def _ac_fields(power: int | None = None, mode: int = AC_MODES.KEEP, fan_speed: int = AC_FAN_SPEEDS.KEEP,
+                   target: int = AC_TARGET_KEEP, **kwargs) -> dict[str, Any]:
+        # status fields an AC_CONTROL_REQUEST sets, changing the mode also turns the AC on
+        fields = {}
+        if mode != AC_MODES.KEEP:
+            fields["ac_mode"] = mode
+            fields["ac_power_state"] = 1
+        elif power is not None:
+            fields["ac_power_state"] = 1 if power else 0
+        if fan_speed != AC_FAN_SPEEDS.KEEP:
+            fields["ac_fan_speed"] = fan_speed
+        if target != AC_TARGET_KEEP:
+            fields["ac_target"] = target
+        return fields
+
+    def _request_timeout(self, key: tuple[int, int], future: asyncio.Future) -> None:
+        if not future.done():
+            _LOGGER.warning("No reply received for message " + str(key[0]) + " with type: " + hex(key[1]))
+            self.metrics.counters["requests_timed_out"] += 1
+            future.set_exception(asyncio.TimeoutError())
+
+    def _request_done(self, key: tuple[int, int], future: asyncio.Future, timer: asyncio.TimerHandle, msg: Message) -> None:
+        timer.cancel()
+        if self._pending.get(key, (None,))[0] is future:
+            del self._pending[key]
+            self._completed[key] = time.monotonic()
+        # retrieving the exception keeps fire-and-forget requests from logging it as unretrieved;
+        # a request given up on must not reach the console later, e.g. after a reconnect
+        if future.cancelled() or future.exception():
+            self._queue.discard(msg)
+
+    def _is_solicited(self, msg: Message) -> bool:
+        # a reply to a pending request, or a late one to a request completed recently;
+        # the console's own messages have id 0
+        if msg.id == 0:
+            return False
+        key = (msg.id, msg.type)
+        if key in self._pending:
+            return True
+        completed = self._completed.get(key)
+        return completed is not None and time.monotonic() - completed < LATE_REPLY_WINDOW
+
+    def _retransmit(self, msg: Message, sent: float) -> None:
+        # not answered within the retransmission timeout: dropped by the console, unless it was
+        # answered, given up on, or sent again after a reconnect meanwhile
+        pending = self._pending.get((msg.id, msg.reply_type))
+        if not pending or pending[1] is not msg or pending[0].done() or msg.sent != sent:
+            return
+        _LOGGER.debug("No reply for message " + str(msg.id) + " within " + str(round(self._pacer.rto, 3)) + "s, sending it again")
+        self.metrics.counters["requests_dropped"] += 1
+        self._pacer.dropped(sent)
+        msg.sent = None
+        msg.retransmitted = True
+        self._queue.requeue(msg)
+
+    def _reply(self, msg: Message) -> None:
+        pending = self._pending.get((msg.id, msg.type))
+        if not pending or pending[0].done():
+            return
+        future, request = pending
+        if request.sent is not None and not request.retransmitted:
+            latency = time.monotonic() - request.sent
+            self.metrics.gauges["last_request_latency"] = latency
+            self.metrics.round_trip_time.observe(latency)
+            self._pacer.replied(latency)
+        else:
+            self._pacer.replied(None)
+        self.metrics.counters["requests_replied"] += 1
+        future.set_result(msg)
+
+    def _receive(self, msg: Message, received: float) -> None:
+        self.metrics.frames_received[msg.type] += 1
+        self._watchdog.frame_received()
+        if msg.type == MSGTYPE_GRP_STAT:
+            self._scheduler.group_status_received(self._is_solicited(msg))
+        self._handle(msg, received)
+        if self._pending:
+            self._reply(msg)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the topology and state, for restore() on the next start."""
+        return {
+            "groups_info": self.groups_info,
+            "acs_info": self.acs_info,
+            "groups": [dict(group) for group in self.groups.values()],
+            "acs": [dict(ac) for ac in self.acs.values()],
+        }
+
+    def restore(self, snapshot: dict[str, Any]) -> bool:
+        """Restore a snapshot (possibly JSON round-tripped), so entities can be created before the console replies."""
+        try:
+            groups_info = {int(group): name for group, name in snapshot["groups_info"].items()}
+            acs_info = {int(unit_number): dict(info,
+                                               ac_modes={int(mode): enabled for mode, enabled in info["ac_modes"].items()},
+                                               fan_modes={int(mode): enabled for mode, enabled in info["fan_modes"].items()})
+                        for unit_number, info in snapshot["acs_info"].items()}
+            groups = [AirTouchGroupStatus(**fields) for fields in snapshot["groups"]]
+            acs = [AirTouchACStatus(**fields) for fields in snapshot["acs"]]
+        except (KeyError, TypeError, ValueError, AttributeError):
+            _LOGGER.warning("Ignoring invalid AirTouch snapshot")
+            return False
+        if not groups or not acs:
+            return False
+        self.groups_info = groups_info
+        self.acs_info = acs_info
+        self.groups = {group.group_number: group for group in groups}
+        self.acs = {ac.ac_unit_number: ac for ac in acs}
+        self._index_groups()
+        self._groups_ready.set()
+        self._acs_ready.set()
+        # refresh the state, and the topology too if the console does not match the snapshot
+        self._verify = {MSGTYPE_GRP_STAT, MSGTYPE_AC_STAT}
+        self._scheduler.request_group_status()
+        self._request(Message.AC_STATUS_REQUEST())
+        return True
+
+    def _verify_topology(self, msg: Message) -> None:
+        self._verify.discard(msg.type)
+        if msg.type == MSGTYPE_GRP_STAT:
+            record_type, info, request = AirTouchGroupStatus, self.groups_info, Message.GROUP_EXTENDED_REQUEST()
+        else:
+            record_type, info, request = AirTouchACStatus, self.acs_info, Message.AC_EXTENDED_REQUEST()
+        numbers = {msg.data[offset] & 0b00111111 for offset in range(0, len(msg.data), record_type.CHUNK_SIZE)}
+        if numbers != set(info):
+            _LOGGER.info("AirTouch does not match the stored " + record_type.__name__ + " snapshot, requesting info...")
+            self._request(request)
+
+    def _check_ready(self) -> None:
+        # ready once both the info and the status of the groups / ACs are known
+        if self.groups and self.groups_info: self._groups_ready.set()
+        if self.acs and self.acs_info: self._acs_ready.set()
+
+    def _handle(self, msg: Message, received: float) -> None:
+        if self._verify and msg.type in self._verify:
+            self._verify_topology(msg)
+        if msg.type == MSGTYPE_GRP_STAT:
+            _LOGGER.debug("Message received is group message!")
+            if not self._is_repeated(msg):
+                updated = []
+                if self._decode_status(msg.data, self.groups, AirTouchGroupStatus, updated):
+                    self._index_groups()
+                self._dispatcher.dispatch(updated, received)
+                self._check_ready()
+        elif msg.type == MSGTYPE_AC_STAT:
+            _LOGGER.debug("Message received is AC message!")
+            if not self._is_repeated(msg):
+                updated = []
+                self._decode_status(msg.data, self.acs, AirTouchACStatus, updated)
+                self._dispatcher.dispatch(updated, received)
+                self._check_ready()
+            self._scheduler.ac_status_received()
+        elif msg.type == MSGTYPE_EXTENDED:
+            _LOGGER.debug("Message received is extended message!")
+            if msg.data[:2] == MSG_EXTENDED_GROUP_DATA:
+                self.groups_info.update(msg.decode_groups_info())
+                self._check_ready()
+                _LOGGER.debug(self.groups_info)
+            elif msg.data[:2] == MSG_EXTENDED_AC_DATA:
+                self.acs_info.update(msg.decode_acs_info())
+                self._index_groups()
+                self._check_ready()
+                _LOGGER.debug(self.acs_info)
+            elif msg.data[:2] == MSG_EXTENDED_ERROR_DATA:
+                self.acs_error_info.update(msg.decode_ac_error_info())
+                _LOGGER.debug(self.acs_error_info)
+        else:
+            _LOGGER.debug("Message received with unknown type: " + hex(msg.type))
+            _LOGGER.debug(msg.data)
+
+    async def _write_msgs(self, messages: list[Message]) -> None:
+        # all the frames in one write, the transport's flow control still applies through drain()
+        build = self._builder.build
+        frames_sent = self.metrics.frames_sent
+        wire = b"".join([build(msg) for msg in messages])
+        sent = time.monotonic()
+        self._transport.write(wire)
+        for msg in messages:
+            msg.sent = sent
+            frames_sent[msg.type] += 1
+        if self._capture:
+            self._capture.write(CAPTURE_SENT, sent, wire)
+        self._pacer.sent(len(messages))
+        # commands are sent with absolute values, so sending a dropped one again is safe
+        loop = asyncio.get_running_loop()
+        for msg in messages:
+            loop.call_later(self._pacer.rto, self._retransmit, msg, sent)
+        self.metrics.counters["writes"] += 1
+        self.metrics.counters["bytes_sent"] += len(wire)
+        await self._protocol.drain()
 
     async def _send(self) -> None:
         _LOGGER.info("Message sender task (re)started...")
-        while (self.want_connection) and (msg := await self._queue.get()):
+        while self.want_connection:
+            await self._connected.wait()
+            # pace once there is something to send, so the gap and the tokens are current
+            await self._queue.wait()
+            count = await self._pacer.wait()
+            messages = await self._queue.get_batch(min(count, SEND_BATCH_MAX_FRAMES))
+            self.metrics.gauges["send_queue_depth"] = self._queue.qsize()
             try:
-                await self._write_msg(msg)
+                await self._write_msgs(messages)
             except Exception:
-                _LOGGER.error("Error sending message! Deleting existing connection and retry sending in 5 seconds...")
-                _LOGGER.debug("PS: somebody else should restart the connection, we'll just try retry sending in 5s...")
-                self.connected = False
-                self._reader = None
-                self._writer = None
-                await asyncio.sleep(5)
-                self._queue.put_nowait(msg)
-            self._queue.task_done()
-
-    async def request_group_status(self) -> None:
-        self._queue.put_nowait(Message.GROUP_STATUS_REQUEST())
+                _LOGGER.error("Error sending messages! Reconnecting, the messages are sent again once connected...")
+                for msg in reversed(messages):
+                    self._queue.requeue(msg)
+                self._abort()
+
+    async def request_group_status(self) -> Message:
+        return await self._scheduler.request_group_status()
     
-    async def request_group_info(self) -> None:
-        self._queue.put_nowait(Message.GROUP_EXTENDED_REQUEST())
+    async def request_group_info(self) -> Message:
+        return await self._request(Message.GROUP_EXTENDED_REQUEST())
+
+    async def request_group_open_perc(self, group: int, percentage: int) -> Message | None:
+        percentage = DAMPER_STEP * round(percentage / DAMPER_STEP)
+        current = self.groups.get(group)
+        control = dict(group_number=group, target_type=GROUP_TARGET_TYPES.DAMPER, target=percentage)
+        msg = Message.GROUP_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and current.group_open_perc == percentage, current, self._group_fields(**control))
 
-    async def request_group_open_perc(self, group: int, percentage: int) -> None:
-        msg = Message.GROUP_CONTROL_REQUEST(group_number=group, target_type=GROUP_TARGET_TYPES.DAMPER, target=int(percentage))
-        self._queue.put_nowait(msg)
+    async def request_group_target_temp(self, group: int, temp: int) -> Message | None:
+        current = self.groups.get(group)
+        control = dict(group_number=group, target_type=GROUP_TARGET_TYPES.TEMPERATURE, target=int(temp))
+        msg = Message.GROUP_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and current.group_target == int(temp), current, self._group_fields(**control))
 
-    async def request_group_target_temp(self, group: int, temp: int) -> None:
-        msg = Message.GROUP_CONTROL_REQUEST(group_number=group, target_type=GROUP_TARGET_TYPES.TEMPERATURE, target=int(temp))
-        self._queue.put_nowait(msg)
+    async def request_group_control_type(self, group: int, control_type: int) -> Message | None:
+        current = self.groups.get(group)
+        control = dict(group_number=group, control_type=control_type)
+        msg = Message.GROUP_CONTROL_REQUEST(**control)
+        # status reports 0 for damper and 1 for temperature control
+        unchanged = current is not None and control_type in (GROUP_CONTROL_TYPES.DAMPER, GROUP_CONTROL_TYPES.TEMPERATURE) \
+            and current.group_control_type == control_type - GROUP_CONTROL_TYPES.DAMPER
+        return await self._command(msg, unchanged, current, self._group_fields(**control))
 
-    async def request_group_control_type(self, group: int, control_type: int) -> None:
-        msg = Message.GROUP_CONTROL_REQUEST(group_number=group, control_type=control_type)
-        self._queue.put_nowait(msg)
+    async def request_group_power(self, group, power: int) -> Message | None:
+        current = self.groups.get(group)
+        control = dict(group_number=group, power=power)
+        msg = Message.GROUP_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and bool(current.group_power_state) == bool(power), current, self._group_fields(**control))
 
-    async def request_group_power(self, group, power: int) -> None:
-        msg = Message.GROUP_CONTROL_REQUEST(group_number=group, power=power)
-        self._queue.put_nowait(msg)
+    async def request_groups(self, controls: list[dict[str, Any]]) -> Message:
+        """Apply several group controls (GROUP_CONTROL_REQUEST arguments) with a single frame."""
+        controls = [dict(control, target=DAMPER_STEP * round(control["target"] / DAMPER_STEP))
+                    if control.get("target_type") == GROUP_TARGET_TYPES.DAMPER else control for control in controls]
+        msg = Message.GROUPS_CONTROL_REQUEST(controls)
+        for control in controls:
+            group = self.groups.get(control["group_number"])
+            if group is not None:
+                self._set_optimistic(group, self._group_fields(**control), msg.reply_type)
+        return await self._request(msg)
 
-    async def request_ac_status(self) -> None:
-        self._queue.put_nowait(Message.AC_STATUS_REQUEST())
+    async def request_acs(self, controls: list[dict[str, Any]]) -> Message:
+        """Apply several AC controls (AC_CONTROL_REQUEST arguments) with a single frame."""
+        msg = Message.ACS_CONTROL_REQUEST(controls)
+        for control in controls:
+            ac = self.acs.get(control["unit_number"])
+            if ac is not None:
+                self._set_optimistic(ac, self._ac_fields(**control), msg.reply_type)
+        return await self._request(msg)
 
-    async def request_ac_info(self) -> None:
-        self._queue.put_nowait(Message.AC_EXTENDED_REQUEST())
+    async def request_ac_status(self) -> Message:
+        return await self._request(Message.AC_STATUS_REQUEST())
+
+    async def request_ac_info(self) -> Message:
+        return await self._request(Message.AC_EXTENDED_REQUEST())
     
-    async def request_ac_hvac_mode(self, ac: int, mode: int) -> None:
-        msg = Message.AC_CONTROL_REQUEST(unit_number=ac, mode=mode)
-        self._queue.put_nowait(msg)
+    async def request_ac_error_info(self, ac: int) -> Message:
+        return await self._request(Message.AC_ERROR_REQUEST(ac))
+
+    async def request_ac_hvac_mode(self, ac: int, mode: int) -> Message | None:
+        current = self.acs.get(ac)
+        control = dict(unit_number=ac, mode=mode)
+        msg = Message.AC_CONTROL_REQUEST(**control)
+        # changing the mode also turns the AC on
+        return await self._command(msg, current is not None and current.ac_mode == mode and current.ac_power_state == 1, current, self._ac_fields(**control))
 
-    async def request_ac_fan_mode(self, ac: int, fan_mode: int) -> None:
-        msg = Message.AC_CONTROL_REQUEST(unit_number=ac, fan_speed=fan_mode)
-        self._queue.put_nowait(msg)
+    async def request_ac_fan_mode(self, ac: int, fan_mode: int) -> Message | None:
+        current = self.acs.get(ac)
+        control = dict(unit_number=ac, fan_speed=fan_mode)
+        msg = Message.AC_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and current.ac_fan_speed == fan_mode, current, self._ac_fields(**control))
 
-    async def request_ac_target_temp(self, ac: int, temp: int) -> None:
-        msg = Message.AC_CONTROL_REQUEST(unit_number=ac, target=temp)
-        self._queue.put_nowait(msg)
+    async def request_ac_target_temp(self, ac: int, temp: int) -> Message | None:
+        current = self.acs.get(ac)
+        control = dict(unit_number=ac, target=temp)
+        msg = Message.AC_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and current.ac_target == temp, current, self._ac_fields(**control))
 
-    async def request_ac_power(self, ac: int, power: int) -> None:
-        msg = Message.AC_CONTROL_REQUEST(unit_number=ac, power=power)
-        self._queue.put_nowait(msg)
+    async def request_ac_power(self, ac: int, power: int) -> Message | None:
+        current = self.acs.get(ac)
+        control = dict(unit_number=ac, power=power)
+        msg = Message.AC_CONTROL_REQUEST(**control)
+        return await self._command(msg, current is not None and (current.ac_power_state == 1) == bool(power), current, self._ac_fields(**control))
@@ -12,7 +12,7 @@ async def async_setup_entry(hass, config_entry, async_add_devices):
     airtouch = hass.data[DOMAIN][config_entry.entry_id]
 
     new_devices = []
-    for group in airtouch.groups:
+    for group in airtouch.groups.values():
         turbo_sensor = AirTouchGroupTurbo(airtouch, group)
         new_devices.append(turbo_sensor)
         spill_sensor = AirTouchGroupBattery(airtouch, group)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+from typing import BinaryIO, Iterator
+
+import asyncio
+import struct
+
+import logging
+_LOGGER = logging.getLogger(__name__)
+
+# capture file layout: magic, then one record per chunk of raw bytes
+# record: direction (1 byte), monotonic timestamp (double), length (4 bytes), raw bytes
+CAPTURE_MAGIC = b"AT4CAP\x00\x01"
+CAPTURE_RECORD = struct.Struct(">BdI")
+CAPTURE_RECEIVED = 0
+CAPTURE_SENT = 1
+# bytes buffered in memory before they are handed to an executor thread to write
+CAPTURE_BUFFER_SIZE = 64 * 1024
+
+class Capture:
+    """Appends raw wire data with its direction and monotonic timestamp to a binary log.
+
+    The constructor opens the file, create it in an executor. write() runs on the event loop and
+    only appends to a memory buffer, full buffers are written by the loop's default executor, one
+    at a time so the records stay in order. Up to CAPTURE_BUFFER_SIZE bytes are lost if Home
+    Assistant crashes, close() writes the rest.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file: BinaryIO = open(path, "wb")
+        self._file.write(CAPTURE_MAGIC)
+        self._buffer = bytearray()
+        self._writing: asyncio.Future = None
+        self._failed = False
+        _LOGGER.info("Capturing AirTouch traffic to " + path)
+
+    def write(self, direction: int, timestamp: float, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += CAPTURE_RECORD.pack(direction, timestamp, len(data))
+        buffer += data
+        if len(buffer) >= CAPTURE_BUFFER_SIZE and self._writing is None:
+            self._flush()
+
+    def _flush(self) -> None:
+        data, self._buffer = self._buffer, bytearray()
+        if self._failed:
+            return
+        self._writing = asyncio.get_running_loop().run_in_executor(None, self._file.write, data)
+        self._writing.add_done_callback(self._written)
+
+    def _written(self, future: asyncio.Future) -> None:
+        self._writing = None
+        if future.exception():
+            self._failed = True
+            _LOGGER.error("Cannot write AirTouch capture to " + self.path + ": " + str(future.exception()))
+        elif len(self._buffer) >= CAPTURE_BUFFER_SIZE:
+            self._flush()
+
+    async def close(self) -> None:
+        """Write the buffered records and close the file, in an executor."""
+        while self._writing:
+            await asyncio.wait([self._writing])
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+    def _close(self) -> None:
+        if self._file.closed:
+            return
+        try:
+            if not self._failed:
+                self._file.write(self._buffer)
+        finally:
+            self._file.close()
+        _LOGGER.info("Stopped capturing AirTouch traffic to " + self.path)
+
+def read_capture(path: str) -> Iterator[tuple[int, float, bytes]]:
+    """Yield the (direction, timestamp, data) records of a capture file, stops at a truncated record."""
+    with open(path, "rb") as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError("Not an AirTouch capture file: " + path)
+        while header := file.read(CAPTURE_RECORD.size):
+            if len(header) < CAPTURE_RECORD.size:
+                return
+            direction, timestamp, length = CAPTURE_RECORD.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            yield direction, timestamp, data
@@ -28,6 +28,7 @@ from homeassistant.const import ATTR_TEMPERATURE, TEMP_CELSIUS
 from homeassistant.helpers.entity import DeviceInfo
 
 from .const import DOMAIN
+from .entity import airtouch_command
 from .protocol import GROUP_CONTROL_TYPES, PRESETS
 
 import logging
@@ -65,10 +66,10 @@ async def async_setup_entry(hass, config_entry, async_add_devices):
     airtouch = hass.data[DOMAIN][config_entry.entry_id]
 
     new_devices = []
-    for ac in airtouch.acs:
+    for ac in airtouch.acs.values():
         ac_entity = AirTouchACThermostat(airtouch, ac)
         new_devices.append(ac_entity)
-    for group in airtouch.groups:
+    for group in airtouch.groups.values():
         if group.group_has_sensor:
             group_entity = AirTouchGroupThermostat(airtouch, group)
             new_devices.append(group_entity)
@@ -205,6 +206,7 @@ class AirTouchGroupThermostat(ClimateEntity):
             presets.append(PRESETS.ITC)
         return presets
 
+    @airtouch_command
     async def async_set_hvac_mode(self, hvac_mode):
         """Set new target hvac mode."""
         if hvac_mode == self.hvac_mode and hvac_mode != HVAC_MODE_OFF:
@@ -215,19 +217,21 @@ class AirTouchGroupThermostat(ClimateEntity):
             await self._airtouch.request_group_power(self._id, POWER_ON)
         self.async_write_ha_state()
 
+    @airtouch_command
     async def async_set_temperature(self, **kwargs):
         """Set new target temperature."""
         temp = kwargs.get(ATTR_TEMPERATURE)
         if temp is None or temp == self.target_temperature:
             return
-        await self._airtouch.request_group_target_temp(self._id, temp) and self.async_write_ha_state()
+        await self._airtouch.request_group_target_temp(self._id, temp)
 
+    @airtouch_command
     async def async_set_preset_mode(self, preset_mode):
         """Set the preset mode of the fan."""
         if preset_mode == self.preset_mode:
             return
         control_type = GROUP_CONTROL_TYPES.DAMPER if preset_mode == PRESETS.DAMPER else GROUP_CONTROL_TYPES.TEMPERATURE
-        await self._airtouch.request_group_control_type(self._id, control_type) and self.async_write_ha_state()
+        await self._airtouch.request_group_control_type(self._id, control_type)
 
 class AirTouchACThermostat(ClimateEntity):
     def __init__(self, airtouch, ac):
@@ -403,6 +407,7 @@ class AirTouchACThermostat(ClimateEntity):
         total_active = len([group for group in self._groups if group.group_power_state == POWER_ON])
         return (itc_control < total_active and SUPPORT_TARGET_TEMPERATURE) | (len(self.fan_modes) > 0 and SUPPORT_FAN_MODE)
 
+    @airtouch_command
     async def async_set_hvac_mode(self, hvac_mode):
         """Set new target hvac mode."""
         if hvac_mode == self.hvac_mode and hvac_mode != HVAC_MODE_OFF:
@@ -416,24 +421,28 @@ class AirTouchACThermostat(ClimateEntity):
             mode is not None and await self._airtouch.request_ac_hvac_mode(self._id, mode)
         self.async_write_ha_state()
 
+    @airtouch_command
     async def async_set_fan_mode(self, fan_mode):
         """Set new target fan mode."""
         if fan_mode == self.fan_mode:
             return
         mode = MAP_VALUE_SEARCH(MAP_AC_FAN_MODE, fan_mode)
-        mode is not None and await self._airtouch.request_ac_fan_mode(self._id, mode) and self.async_write_ha_state()
+        mode is not None and await self._airtouch.request_ac_fan_mode(self._id, mode)
 
+    @airtouch_command
     async def async_set_temperature(self, **kwargs):
         """Set new target temperature."""
         temp = kwargs.get(ATTR_TEMPERATURE)
         if temp is None or temp == self.target_temperature:
             return
-        await self._airtouch.request_ac_target_temp(self._id, int(temp)) and self.async_write_ha_state()
+        await self._airtouch.request_ac_target_temp(self._id, int(temp))
 
+    @airtouch_command
     async def async_turn_on(self):
         """Turn on."""
-        await self._airtouch.request_ac_power(self._id, POWER_ON) and self.async_write_ha_state()
+        await self._airtouch.request_ac_power(self._id, POWER_ON)
 
+    @airtouch_command
     async def async_turn_off(self):
         """Turn off."""
-        await self._airtouch.request_ac_power(self._id, POWER_OFF) and self.async_write_ha_state()
+        await self._airtouch.request_ac_power(self._id, POWER_OFF)
@@ -8,7 +8,7 @@ from homeassistant.const import CONF_HOST
 import voluptuous as vol
 import asyncio
 
-from .const import DOMAIN
+from .const import DOMAIN, DATA_HANDOFF
 from .airtouch4 import AirTouch4
 
 import logging
@@ -35,22 +35,34 @@ class AirTouch4ConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
             )
 
         errors = {}
+        host = user_input[CONF_HOST]
+        await self.async_set_unique_id(host)
+        self._abort_if_unique_id_configured()
 
-        airtouch = AirTouch4(user_input[CONF_HOST])
+        # a single frame is enough to validate the host
+        airtouch = AirTouch4(host)
         try:
-            await asyncio.wait_for(airtouch.ready(), 5)
+            await asyncio.wait_for(airtouch.probe(), 5)
         except asyncio.TimeoutError:
             errors["base"] = "cannot_connect"
         except:
             _LOGGER.exception("Unknown error connecting to the Airtouch")
             errors["base"] = "unknown"
-        await airtouch.disconnect()
 
         if errors:
+            await airtouch.disconnect()
             return self.async_show_form(
                 step_id="user", data_schema=DATA_SCHEMA, errors=errors
             )
 
+        # keep the verified connection and start the handshake, the new config entry takes them over
+        handoff = self.hass.data.setdefault(DATA_HANDOFF, {})
+        previous = handoff.pop(host, None)
+        if previous:
+            await previous.disconnect()
+        handoff[host] = airtouch
+        self.hass.async_create_task(airtouch.ready())
+
         return self.async_create_entry(
             title="AirTouch 4 (" + user_input[CONF_HOST] + ")",
             data=user_input
@@ -1,3 +1,24 @@
 """Constants for the Airtouch 4 integration."""
 
 DOMAIN = "polyaire"
+# hass.data key for connections verified by the config flow, waiting for their config entry
+DATA_HANDOFF = DOMAIN + "_handoff"
+
+STORAGE_VERSION = 1
+STORAGE_KEY = DOMAIN + ".snapshot"
+# seconds from the first state change until the snapshot is written
+SNAPSHOT_SAVE_DELAY = 300
+
+SERVICE_SET_ZONES = "set_zones"
+SERVICE_START_CAPTURE = "start_capture"
+SERVICE_STOP_CAPTURE = "stop_capture"
+ATTR_ENTRY_ID = "entry_id"
+ATTR_ZONES = "zones"
+ATTR_ZONE = "zone"
+ATTR_POWER = "power"
+ATTR_CONTROL = "control"
+ATTR_OPEN_PERCENTAGE = "open_percentage"
+ATTR_TARGET_TEMPERATURE = "target_temperature"
+ATTR_FILENAME = "filename"
+# capture file in the Home Assistant config folder
+DEFAULT_CAPTURE_FILENAME = DOMAIN + ".cap"
@@ -0,0 +1,33 @@
+"""Diagnostics support for the AirTouch 4 integration."""
+from __future__ import annotations
+from typing import Any
+
+import asyncio
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_HOST
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_HOST}
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the connection state, the AirTouch topology and state, the AC errors and the runtime metrics."""
+    airtouch = hass.data[DOMAIN][entry.entry_id]
+    if airtouch.connected:
+        # the console only describes an AC error code when asked for it
+        for unit_number, ac in airtouch.acs.items():
+            if ac.ac_error_code:
+                try:
+                    await airtouch.request_ac_error_info(unit_number)
+                except asyncio.TimeoutError:
+                    pass
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "connected": airtouch.connected,
+        "airtouch": airtouch.snapshot(),
+        "ac_errors": airtouch.acs_error_info,
+        "metrics": airtouch.metrics.as_dict(),
+    }
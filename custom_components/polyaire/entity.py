@@ -0,0 +1,24 @@
+"""Helpers shared by the AirTouch 4 entities."""
+from __future__ import annotations
+from typing import Any, Awaitable, Callable
+
+import asyncio
+import functools
+
+from homeassistant.exceptions import HomeAssistantError
+
+def airtouch_command(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Decorate an entity service handler, to fail the service call with HomeAssistantError.
+
+    The call fails at once while the AirTouch is disconnected, and when a command is not
+    answered in time, instead of with a bare TimeoutError.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if not self._airtouch.connected:
+            raise HomeAssistantError("AirTouch is not connected")
+        try:
+            return await func(self, *args, **kwargs)
+        except asyncio.TimeoutError as err:
+            raise HomeAssistantError("AirTouch did not answer the command") from err
+    return wrapper
@@ -5,6 +5,7 @@ from homeassistant.components.fan import (
 )
 
 from .const import DOMAIN
+from .entity import airtouch_command
 from .protocol import GROUP_CONTROL_TYPES, PRESETS
 
 import logging
@@ -16,7 +17,7 @@ async def async_setup_entry(hass, config_entry, async_add_devices):
     airtouch = hass.data[DOMAIN][config_entry.entry_id]
 
     new_devices = []
-    for group in airtouch.groups:
+    for group in airtouch.groups.values():
         group_entity = AirTouchGroupDamper(airtouch, group)
         new_devices.append(group_entity)
     
@@ -98,19 +99,22 @@ class AirTouchGroupDamper(FanEntity):
             presets.append(PRESETS.ITC)
         return presets
 
+    @airtouch_command
     async def async_set_percentage(self, percentage):
         """Set the speed percentage of the fan."""
         if percentage == self.percentage or self.preset_mode != PRESETS.DAMPER:
             return
-        await self._airtouch.request_group_open_perc(self._id, percentage) and self.async_write_ha_state()
+        await self._airtouch.request_group_open_perc(self._id, percentage)
 
+    @airtouch_command
     async def async_set_preset_mode(self, preset_mode):
         """Set the preset mode of the fan."""
         if preset_mode == self.preset_mode:
             return
         control_type = GROUP_CONTROL_TYPES.DAMPER if preset_mode == PRESETS.DAMPER else GROUP_CONTROL_TYPES.TEMPERATURE
-        await self._airtouch.request_group_control_type(self._id, control_type) and self.async_write_ha_state()
+        await self._airtouch.request_group_control_type(self._id, control_type)
 
+    @airtouch_command
     async def async_turn_on(self, speed = None, percentage = None, preset_mode = None, **kwargs):
         """Turn on the fan."""
         await self._airtouch.request_group_power(self._id, 1)
@@ -120,6 +124,7 @@ class AirTouchGroupDamper(FanEntity):
             await self.async_set_preset_mode(preset_mode)
         self.async_write_ha_state()
     
+    @airtouch_command
     async def async_turn_off(self, **kwargs):
         """Turn the fan off."""
-        await self._airtouch.request_group_power(self._id, 0) and self.async_write_ha_state()
+        await self._airtouch.request_group_power(self._id, 0)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+from typing import Any
+
+import bisect
+import time
+from collections import Counter, deque
+
+from .protocol import *
+from .send_queue import SEND_LANE_NAMES
+
+# histogram bucket upper bounds, in seconds for the timings
+ROUND_TRIP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+DISPATCH_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+QUEUE_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# seconds of sent frames the frame rate is averaged over
+FRAME_RATE_WINDOW = 10
+
+MSGTYPE_NAMES = {
+    MSGTYPE_GRP_CTRL: "group_control",
+    MSGTYPE_GRP_STAT: "group_status",
+    MSGTYPE_AC_CTRL: "ac_control",
+    MSGTYPE_AC_STAT: "ac_status",
+    MSGTYPE_EXTENDED: "extended",
+}
+
+COUNTERS = (
+    "bytes_received",
+    "bytes_sent",
+    "writes",
+    "frames_decoded",
+    "frames_skipped",
+    "chunks_decoded",
+    "chunks_skipped",
+    "requests_replied",
+    "requests_timed_out",
+    "requests_dropped",
+    "commands_coalesced",
+    "commands_dropped",
+    "lane_promotions",
+    "optimistic_updates",
+    "optimistic_rollbacks",
+    "group_status_pushed",
+    "group_status_polled",
+    "group_status_suppressed",
+    "heartbeats",
+    "dead_links",
+    "reconnects",
+)
+
+GAUGES = (
+    "send_queue_depth",
+    "last_request_latency",
+    "last_dead_link_detection",
+    "last_reconnect_duration",
+    "pacing_gap",
+    "smoothed_round_trip_time",
+    "retransmission_timeout",
+)
+
+class Histogram:
+    """Counts observations into fixed buckets, cheap enough to update on every frame."""
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        # the last bucket counts the observations above the highest bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent: float) -> float | None:
+        """Upper bound of the bucket holding the given percentile, the maximum for the last bucket."""
+        if not self.count:
+            return None
+        rank = self.count * percent / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> dict[str, Any]:
+        buckets = {"le_" + str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+class Metrics:
+    """Counters and histograms for the AirTouch 4 transport and dispatch paths.
+
+    Updates are plain dict and list increments, so the metrics always stay on.
+    CRC and header failures are read from the frame parser, which counts them anyway.
+    """
+    def __init__(self, parser: FrameParser):
+        self._parser = parser
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = dict.fromkeys(GAUGES)
+        self.gauges["send_queue_depth"] = 0
+        self.gauges["pacing_gap"] = 0
+        # frames by message type
+        self.frames_received = Counter()
+        self.frames_sent = Counter()
+        # seconds from sending a request to its reply
+        self.round_trip_time = Histogram(ROUND_TRIP_BUCKETS)
+        # seconds from receiving a frame to the end of the status callbacks it triggered
+        self.dispatch_time = Histogram(DISPATCH_BUCKETS)
+        # send queue depth after every queued request
+        self.send_queue_depth = Histogram(QUEUE_DEPTH_BUCKETS)
+        # seconds from queueing a message to taking it for sending, by send lane
+        self.queue_time = {lane: Histogram(QUEUE_TIME_BUCKETS) for lane in SEND_LANE_NAMES}
+        # (monotonic time, frame count) of the writes within the frame rate window
+        self._writes = deque()
+
+    @property
+    def crc_errors(self) -> int:
+        return self._parser.crc_errors
+
+    @property
+    def header_errors(self) -> int:
+        return self._parser.header_errors
+
+    def _expire_writes(self, now: float) -> None:
+        writes = self._writes
+        start = now - FRAME_RATE_WINDOW
+        while writes and writes[0][0] < start:
+            writes.popleft()
+
+    def frames_written(self, count: int, now: float) -> None:
+        self._expire_writes(now)
+        self._writes.append((now, count))
+
+    @property
+    def frames_per_second(self) -> float:
+        """Frames sent per second over the last FRAME_RATE_WINDOW seconds."""
+        self._expire_writes(time.monotonic())
+        return sum(count for _, count in self._writes) / FRAME_RATE_WINDOW
+
+    @property
+    def drop_rate(self) -> float | None:
+        """Share of the sent requests the console never answered."""
+        counters = self.counters
+        answered = counters["requests_replied"] + counters["requests_dropped"]
+        return counters["requests_dropped"] / answered if answered else None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            **self.counters,
+            "crc_errors": self.crc_errors,
+            "header_errors": self.header_errors,
+            "frames_per_second": self.frames_per_second,
+            "drop_rate": self.drop_rate,
+            **self.gauges,
+            "frames_received": {MSGTYPE_NAMES.get(type, hex(type)): count for type, count in self.frames_received.items()},
+            "frames_sent": {MSGTYPE_NAMES.get(type, hex(type)): count for type, count in self.frames_sent.items()},
+            "round_trip_time": self.round_trip_time.as_dict(),
+            "dispatch_time": self.dispatch_time.as_dict(),
+            "send_queue_depth_histogram": self.send_queue_depth.as_dict(),
+            "queue_time": {SEND_LANE_NAMES[lane]: histogram.as_dict() for lane, histogram in self.queue_time.items()},
+        }
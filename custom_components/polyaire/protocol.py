@@ -1,22 +1,64 @@
 from __future__ import annotations
 from typing import Any, Callable
 
-import os
+import itertools
+import struct
 from types import SimpleNamespace
 
+from .schema import (
+    Field,
+    Flags,
+    Text,
+    layout_size,
+    compile_encoder,
+    compile_iter_decoder,
+    compile_iter_unpacker,
+    compile_record_decoder,
+    compile_record_loader,
+    compile_unpacker,
+    field_mask,
+)
+
 import logging
 _LOGGER = logging.getLogger(__name__)
 
-def crc16(data: bytes) -> int:
-    crc = 0xFFFF
-    for byte in data:
-        crc = crc ^ byte
+def _crc16_table() -> tuple[int, ...]:
+    table = []
+    for byte in range(256):
+        crc = byte
         for _ in range(8):
             odd = crc & 0x0001
             crc = crc >> 1
             if odd: crc = crc ^ 0xA001
+        table.append(crc)
+    return tuple(table)
+
+CRC16_TABLE = _crc16_table()
+
+def crc16(data: bytes, crc: int = 0xFFFF) -> int:
+    """CRC16 (MODBUS) of data, crc continues from the value over the preceding bytes."""
+    table = CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
     return crc
 
+class Crc16:
+    """Incremental CRC16 (MODBUS), can be fed bytes or memoryview chunks as they arrive."""
+    __slots__ = ("value",)
+
+    def __init__(self, data: bytes | memoryview = None):
+        self.value = 0xFFFF
+        if data:
+            self.update(data)
+
+    def update(self, data: bytes | memoryview) -> Crc16:
+        crc = self.value
+        table = CRC16_TABLE
+        for byte in data:
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        self.value = crc
+        return self
+
 ENDIANNESS = "big"
 
 HEADER_BYTES = bytes([0x55, 0x55])
@@ -29,6 +71,12 @@ MSGTYPE_AC_CTRL = 0x2c
 MSGTYPE_AC_STAT = 0x2d
 MSGTYPE_EXTENDED = 0x1f
 
+# status message type the console replies with, by request message type
+MSGTYPE_REPLIES = {
+    MSGTYPE_GRP_CTRL: MSGTYPE_GRP_STAT,
+    MSGTYPE_AC_CTRL: MSGTYPE_AC_STAT,
+}
+
 MSG_NO_DATA = bytes([])
 MSG_EXTENDED_ERROR_DATA = bytes([0xff, 0x10])
 MSG_EXTENDED_AC_DATA = bytes([0xff, 0x11])
@@ -36,6 +84,18 @@ MSG_EXTENDED_GROUP_DATA = bytes([0xff, 0x12])
 
 AC_TARGET_KEEP = 63
 
+# sync(2) + address(2) + id(1) + type(1) + size(2), followed by data and crc(2)
+FRAME_HEADER_SIZE = 8
+FRAME_CRC_SIZE = 2
+# the client sends the frame size before every frame
+FRAME_SIZE_PREFIX = 4
+
+# size prefix, sync, address, id, type, data size
+FRAME_HEADER = struct.Struct(">I2s2sBBH")
+FRAME_CRC = struct.Struct(">H")
+# offset of the id byte in the frame built with its size prefix
+FRAME_ID_OFFSET = FRAME_SIZE_PREFIX + 4
+
 class PRESETS(SimpleNamespace):
     DAMPER = "Damper"
     ITC = "ITC"
@@ -90,18 +150,117 @@ class AC_TARGET_TYPES(SimpleNamespace):
     DECREMENT = 2
     INCREMENT = 3
 
-class Updateable(SimpleNamespace):
+# one layout per message type, see schema.py for the field format
+GROUP_STATUS_LAYOUT = (
+    Field("group_power_state", 0, (7, 6)),
+    Field("group_number", 0, (5, 0)),
+    Field("group_control_type", 1, (7, 7)),
+    Field("group_open_perc", 1, (6, 0)),
+    Field("group_battery_low", 2, (7, 7)),
+    Field("group_has_turbo", 2, (6, 6)),
+    Field("_group_target", 2, (5, 0)),
+    Field("group_has_sensor", 3, (7, 7)),
+    # tenths of a degree
+    Field("_group_temp", 4, (15, 5), offset=-500),
+    Field("group_has_spill", 5, (4, 4)),
+)
+
+AC_STATUS_LAYOUT = (
+    Field("ac_power_state", 0, (7, 6)),
+    Field("ac_unit_number", 0, (5, 0)),
+    Field("ac_mode", 1, (7, 4)),
+    Field("ac_fan_speed", 1, (3, 0)),
+    Field("ac_spill", 2, (7, 7)),
+    Field("ac_timer", 2, (6, 6)),
+    Field("_ac_target", 2, (5, 0)),
+    # tenths of a degree
+    Field("_ac_temp", 4, (15, 5), offset=-500),
+    Field("ac_error_code", 6, (15, 0)),
+)
+
+# extended messages, after the 2 bytes naming the message
+GROUP_INFO_LAYOUT = (
+    Field("group_number", 0),
+    Text("group_name", 1, 8),
+)
+
+AC_INFO_LAYOUT = (
+    Field("ac_unit_number", 0),
+    Text("ac_unit_name", 2, 16),
+    Field("ac_group_start", 18),
+    Field("ac_group_count", 19),
+    # COOL, FAN, DRY, HEAT, AUTO
+    Flags("ac_modes", 20, (4, 0)),
+    # TURBO, POWERFUL, HIGH, MEDIUM, LOW, QUIET, AUTO
+    Flags("fan_modes", 21, (6, 0)),
+    Field("ac_min_temp", 22),
+    Field("ac_max_temp", 23),
+)
+
+AC_ERROR_LAYOUT = (
+    Field("ac_unit_number", 0),
+    Field("ac_error_length", 1),
+    Text("ac_error_info", 2, "ac_error_length"),
+)
+
+# control records, several can be sent in one frame
+CONTROL_SIZE = 4
+
+GROUP_CONTROL_LAYOUT = (
+    Field("group_number", 0),
+    Field("power_state", 1, (2, 0)),
+    Field("control_type", 1, (4, 3)),
+    Field("target_type", 1, (7, 5)),
+    Field("target", 2),
+)
+
+AC_CONTROL_LAYOUT = (
+    Field("power_state", 0, (7, 6)),
+    Field("unit_number", 0, (5, 0)),
+    Field("mode", 1, (7, 4)),
+    Field("fan_speed", 1, (3, 0)),
+    Field("target_type", 2, (7, 6)),
+    Field("target", 2, (5, 0)),
+)
+
+GROUP_INFO_SIZE = layout_size(GROUP_INFO_LAYOUT)
+AC_INFO_SIZE = layout_size(AC_INFO_LAYOUT)
+
+# largest known payloads are the extended info of 16 groups and an AC error with 255 bytes of
+# text, a larger size field is corrupt and must not hold back the frames behind it while the
+# parser waits for the data
+FRAME_MAX_DATA_SIZE = max(len(MSG_EXTENDED_GROUP_DATA) + 16 * GROUP_INFO_SIZE,
+                          len(MSG_EXTENDED_ERROR_DATA) + layout_size(AC_ERROR_LAYOUT) + 255)
+
+_unpack_groups_info = compile_iter_unpacker(GROUP_INFO_LAYOUT, GROUP_INFO_SIZE)
+_decode_acs_info = compile_iter_decoder(AC_INFO_LAYOUT, AC_INFO_SIZE)
+_unpack_ac_error = compile_unpacker(AC_ERROR_LAYOUT)
+_encode_group_control = compile_encoder(GROUP_CONTROL_LAYOUT, CONTROL_SIZE)
+_encode_ac_control = compile_encoder(AC_CONTROL_LAYOUT, CONTROL_SIZE)
+
+class Updateable:
+    """Fixed-layout status record, subclasses list their public fields in _fields."""
+    __slots__ = ("_callbacks", "_raw", "_optimistic")
+    _fields: tuple[str, ...] = ()
+    CHUNK_SIZE = 0
+    # bits of the status chunk covered by a field
+    FIELD_MASK = 0
+
     def __init__(self, **kwargs):
-        super().__init__(**kwargs)
         self._callbacks = set()
-
-    def __hash__(self):
-        return hash(self.__dict__)
+        # raw status chunk the record was last decoded from, empty when set by other means
+        self._raw = b""
+        # fields shown before the console confirmed them: name -> (value, last reported value, deadline)
+        self._optimistic = None
+        for key in self._fields:
+            setattr(self, key, kwargs.get(key, 0))
 
     def __iter__(self):
-        for key in self.__dict__:
-            if not key.startswith("_"):
-                yield key, getattr(self, key)
+        for key in self._fields:
+            yield key, getattr(self, key)
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + ", ".join(key + "=" + repr(value) for key, value in self) + ")"
 
     def register_callback(self, callback: Callable[[], None]) -> None:
         """Register callback, called when a device changes state."""
@@ -111,47 +270,183 @@ class Updateable(SimpleNamespace):
         """Remove previously registered callback."""
         self._callbacks.discard(callback)
 
-    def update(self, status: dict) -> bool:
+    @property
+    def callbacks(self) -> set[Callable[[], None]]:
+        return self._callbacks
+
+    def matches(self, data: bytes, offset: int = 0) -> bool:
+        """Return True if the status chunk at offset has the field bits this record was last decoded from."""
+        raw = self._raw
+        if not raw:
+            return False
+        chunk = data[offset:offset + self.CHUNK_SIZE]
+        if chunk == raw:
+            return True
+        # the console also flips bits no field covers, those chunks need no decode either
+        return not (int.from_bytes(raw, ENDIANNESS) ^ int.from_bytes(chunk, ENDIANNESS)) & self.FIELD_MASK
+
+    @property
+    def optimistic(self) -> dict[str, Any]:
+        """Return the fields waiting for the console to confirm them."""
+        return {key: value for key, (value, _, _) in self._optimistic.items()} if self._optimistic else {}
+
+    def set_optimistic(self, fields: dict[str, Any], deadline: float) -> bool:
+        """Show fields before the console confirms them, returns True if a field changed."""
+        optimistic = self._optimistic or {}
         updated = False
-        for key, value in status.items():
-            if hasattr(self, key) and type(value) is not set and getattr(self, key) != value:
+        for key, value in fields.items():
+            current = getattr(self, key)
+            reported = optimistic[key][1] if key in optimistic else current
+            optimistic[key] = (value, reported, deadline)
+            if current != value:
                 setattr(self, key, value)
                 updated = True
-        if updated:
-            for callback in self._callbacks:
-                id = self.group_number if hasattr(self, "group_number") else self.ac_unit_number
-                _LOGGER.debug("Updated " + self.__class__.__name__ + " " + str(id) + " status, calling: " + str(callback))
-                callback()
+        self._optimistic = optimistic
+        # the next status chunk has to be decoded to confirm the fields, even if it did not change
+        self._raw = b""
+        return updated
+
+    def confirm_optimistic(self) -> None:
+        """Check the optimistic fields against the status just decoded, the unconfirmed ones are still shown."""
+        optimistic = self._optimistic
+        for key, (value, _, deadline) in list(optimistic.items()):
+            reported = getattr(self, key)
+            if reported == value:
+                del optimistic[key]
+            else:
+                # the frame may predate the command, keep the value until the deadline
+                optimistic[key] = (value, reported, deadline)
+                setattr(self, key, value)
+        if not optimistic:
+            self._optimistic = None
+
+    def expire_optimistic(self, now: float) -> list[str]:
+        """Roll back the optimistic fields not confirmed by now to their reported values, returns their names."""
+        optimistic = self._optimistic
+        if not optimistic:
+            return []
+        expired = [key for key, (_, _, deadline) in optimistic.items() if deadline <= now]
+        for key in expired:
+            setattr(self, key, optimistic.pop(key)[1])
+        if not optimistic:
+            self._optimistic = None
+        if expired:
+            self._raw = b""
+        return expired
+
+    def _log_updated(self) -> None:
+        if not _LOGGER.isEnabledFor(logging.DEBUG):
+            return
+        id = self.group_number if hasattr(self, "group_number") else self.ac_unit_number
+        _LOGGER.debug("Updated " + self.__class__.__name__ + " " + str(id) + " status")
+
+    @classmethod
+    def from_bytes(cls, data: bytes, offset: int = 0) -> Updateable:
+        # every field is set by _load, skip the defaults of __init__
+        record = cls.__new__(cls)
+        record._callbacks = set()
+        record._optimistic = None
+        record._load(data, offset)
+        return record
+
+    def decode(self, data: bytes, offset: int = 0) -> bool:
+        raise NotImplementedError
+
+    def _load(self, data: bytes, offset: int = 0) -> None:
+        raise NotImplementedError
 
 class AirTouchGroupStatus(Updateable):
+    # temperatures are kept as fixed-point integers: target in degrees, temp in tenths of a degree
+    __slots__ = ("group_power_state", "group_number", "group_control_type", "group_open_perc", "group_battery_low",
+                 "group_has_turbo", "_group_target", "group_has_sensor", "_group_temp", "group_has_spill")
+    _fields = ("group_power_state", "group_number", "group_control_type", "group_open_perc", "group_battery_low",
+               "group_has_turbo", "group_target", "group_has_sensor", "group_temp", "group_has_spill")
+    CHUNK_SIZE = layout_size(GROUP_STATUS_LAYOUT)
+    FIELD_MASK = field_mask(GROUP_STATUS_LAYOUT, CHUNK_SIZE)
+
     group_power_state: int
     group_number: int
     group_control_type: int
     group_open_perc: int
     group_battery_low: int
     group_has_turbo: int
-    group_target: int
     group_has_sensor: int
-    group_temp: float
     group_has_spill: int
 
+    @property
+    def group_target(self) -> float:
+        return float(self._group_target)
+
+    @group_target.setter
+    def group_target(self, value: float) -> None:
+        self._group_target = int(value)
+
+    @property
+    def group_temp(self) -> float:
+        return self._group_temp / 10
+
+    @group_temp.setter
+    def group_temp(self, value: float) -> None:
+        self._group_temp = round(value * 10)
+
+    decode = compile_record_decoder(GROUP_STATUS_LAYOUT, CHUNK_SIZE)
+    _load = compile_record_loader(GROUP_STATUS_LAYOUT, CHUNK_SIZE)
+
 class AirTouchACStatus(Updateable):
+    # temperatures are kept as fixed-point integers: target in degrees, temp in tenths of a degree
+    __slots__ = ("ac_power_state", "ac_unit_number", "ac_mode", "ac_fan_speed", "ac_spill", "ac_timer",
+                 "_ac_target", "_ac_temp", "ac_error_code")
+    _fields = ("ac_power_state", "ac_unit_number", "ac_mode", "ac_fan_speed", "ac_spill", "ac_timer",
+               "ac_target", "ac_temp", "ac_error_code")
+    CHUNK_SIZE = layout_size(AC_STATUS_LAYOUT)
+    FIELD_MASK = field_mask(AC_STATUS_LAYOUT, CHUNK_SIZE)
+
     ac_power_state: int
     ac_unit_number: int
     ac_mode: int
     ac_fan_speed: int
     ac_spill: int
     ac_timer: int
-    ac_target: int
-    ac_temp: float
     ac_error_code: int
 
+    @property
+    def ac_target(self) -> float:
+        return float(self._ac_target)
+
+    @ac_target.setter
+    def ac_target(self, value: float) -> None:
+        self._ac_target = int(value)
+
+    @property
+    def ac_temp(self) -> float:
+        return self._ac_temp / 10
+
+    @ac_temp.setter
+    def ac_temp(self, value: float) -> None:
+        self._ac_temp = round(value * 10)
+
+    decode = compile_record_decoder(AC_STATUS_LAYOUT, CHUNK_SIZE)
+    _load = compile_record_loader(AC_STATUS_LAYOUT, CHUNK_SIZE)
+
 class Message:
-    def __init__(self, data: bytes, type: int, id: int = None, extended: bool = False):
+    # message ids are allocated in sequence, 0 is left for the console's own messages
+    _ids = itertools.cycle(range(1, 256))
+
+    def __init__(self, data: bytes, type: int, id: int = None, extended: bool = False, key: Any = None):
         self.data = data
         self.type = type
-        self.id = id or os.urandom(1)
+        self.id = id if id is not None else next(Message._ids)
         self.extended = extended
+        # queued messages with the same key are merged, only the latest one is sent
+        self.key = key
+        # monotonic time the message was written to the console
+        self.sent = None
+        # sent again after no reply came in time, its reply gives no round trip time
+        self.retransmitted = False
+
+    @property
+    def reply_type(self) -> int:
+        return MSGTYPE_REPLIES.get(self.type, self.type)
 
     def isValid(self) -> bool:
         return (self.id is not None
@@ -159,102 +454,49 @@ class Message:
                 and self.data is not None)
 
     def encode(self) -> tuple[bytes, bytes]:
-        size_bytes = len(self.data).to_bytes(2, ENDIANNESS)
-        address = EXTENDED_ADDRESS_BYTES if self.extended else ADDRESS_BYTES
-        payload = address + self.id + self.type.to_bytes(1, ENDIANNESS) + size_bytes + self.data
-        crc = crc16(payload)
-        crc_bytes = crc.to_bytes(2, ENDIANNESS)
-        message = HEADER_BYTES + payload + crc_bytes
-        return len(message).to_bytes(4, ENDIANNESS), message
+        """Return the size prefix and the frame, see FrameBuilder.build() for both in one."""
+        wire = _frame_builder.build(self)
+        return wire[:FRAME_SIZE_PREFIX], wire[FRAME_SIZE_PREFIX:]
 
     def decode_groups_status(self) -> dict[int, AirTouchGroupStatus]:
         if not self.isValid():
             return None
         groups = dict()
-        chunk = 6
-        for group in [self.data[i:i+chunk] for i in range(0, len(self.data), chunk)]:
-            group_number = group[0] & 0b00111111
-            groups[group_number] = AirTouchGroupStatus(
-                group_power_state = (group[0] & 0b11000000) >> 6,
-                group_number = group_number,
-                group_control_type = (group[1] & 0b10000000) >> 7,
-                group_open_perc = group[1] & 0b01111111,
-                group_battery_low = (group[2] & 0b10000000) >> 7,
-                group_has_turbo = (group[2] & 0b01000000) >> 6,
-                group_target = (group[2] & 0b00111111) * 1.0,
-                group_has_sensor = (group[3] & 0b10000000) >> 7,
-                group_temp = (((group[4] << 3) + ((group[5] & 0b11100000) >> 5)) - 500) / 10,
-                group_has_spill = (group[5] & 0b00010000) >> 4
-            )
+        for offset in range(0, len(self.data), AirTouchGroupStatus.CHUNK_SIZE):
+            group = AirTouchGroupStatus.from_bytes(self.data, offset)
+            groups[group.group_number] = group
         return groups
     
     def decode_groups_info(self) -> dict[int, str]:
         if not self.isValid():
             return None
-        groups_info = dict()
-        data = self.data[2:]
-        chunk = 9
-        for group in [data[i:i+chunk] for i in range(0, len(data), chunk)]:
-            group_number = group[0]
-            group_name = group[1:].decode("utf-8").rstrip("\x00")
-            groups_info[group_number] = group_name
-        return groups_info
+        return dict(_unpack_groups_info(self.data, 2))
 
     def decode_acs_status(self) -> dict[int, AirTouchACStatus]:
         if not self.isValid():
             return None
         acs = dict()
-        chunk = 8
-        for ac in [self.data[i:i+chunk] for i in range(0, len(self.data), chunk)]:
-            ac_unit_number = ac[0] & 0b00111111
-            acs[ac_unit_number] = AirTouchACStatus(
-                ac_power_state = (ac[0] & 0b11000000) >> 6,
-                ac_unit_number = ac_unit_number,
-                ac_mode = (ac[1] & 0b11110000) >> 4,
-                ac_fan_speed = ac[1] & 0b00001111,
-                ac_spill = (ac[2] & 0b10000000) >> 7,
-                ac_timer = (ac[2] & 0b01000000) >> 6,
-                ac_target = (ac[2] & 0b00111111) * 1.0,
-                ac_temp = (((ac[4] << 3) + ((ac[5] & 0b11100000) >> 5)) - 500) / 10,
-                ac_error_code = (ac[6] << 8) + (ac[7])
-            )
+        for offset in range(0, len(self.data), AirTouchACStatus.CHUNK_SIZE):
+            ac = AirTouchACStatus.from_bytes(self.data, offset)
+            acs[ac.ac_unit_number] = ac
         return acs
 
     def decode_acs_info(self) -> dict[int, Any]:
         if not self.isValid():
             return None
-        acs_info = dict()
-        data = self.data[2:]
-        chunk = int(len(data)/int(len(data)/24))
-        for ac in [data[i:i+chunk] for i in range(0, len(data), chunk)]:
-            ac_unit_number = ac[0]
-            acs_info[ac_unit_number] = {
-                "ac_unit_name": ac[2:18].decode("utf-8").rstrip("\x00"),
-                "ac_group_start": ac[18],
-                "ac_group_count": ac[19],
-                "ac_min_temp": ac[22],
-                "ac_max_temp": ac[23],
-                "ac_modes": {
-                    4: bool(ac[20] & 0b00010000),   # COOL
-                    3: bool(ac[20] & 0b00001000),   # FAN
-                    2: bool(ac[20] & 0b00000100),   # DRY
-                    1: bool(ac[20] & 0b00000010),   # HEAT
-                    0: bool(ac[20] & 0b00000001),   # AUTO
-                },
-                "fan_modes": {
-                    6: bool(ac[21] & 0b01000000),   # TURBO
-                    5: bool(ac[21] & 0b00100000),   # POWERFUL
-                    4: bool(ac[21] & 0b00010000),   # HIGH
-                    3: bool(ac[21] & 0b00001000),   # MEDIUM
-                    2: bool(ac[21] & 0b00000100),   # LOW
-                    1: bool(ac[21] & 0b00000010),   # QUIET
-                    0: bool(ac[21] & 0b00000001),   # AUTO
-                }
-            }
-        return acs_info
+        count = (len(self.data) - 2) // AC_INFO_SIZE
+        # records may be padded beyond the fields we know
+        stride = (len(self.data) - 2) // count if count else AC_INFO_SIZE
+        return {info.pop("ac_unit_number"): info for info in _decode_acs_info(self.data, 2, stride)}
 
-    @classmethod
-    def GROUP_CONTROL_REQUEST(cls, group_number: int, power: int = None, control_type: int = GROUP_CONTROL_TYPES.KEEP, target_type: int = GROUP_TARGET_TYPES.KEEP, target: int = 0) -> Message:
+    def decode_ac_error_info(self) -> dict[int, str]:
+        if not self.isValid():
+            return None
+        unit_number, _, error_info = _unpack_ac_error(self.data, 2)
+        return {unit_number: error_info}
+
+    @staticmethod
+    def group_control_data(group_number: int, power: int = None, control_type: int = GROUP_CONTROL_TYPES.KEEP, target_type: int = GROUP_TARGET_TYPES.KEEP, target: int = 0) -> bytes:
         if power is None:
             power_state = GROUP_POWER_STATES.KEEP
         elif power == 0:
@@ -262,23 +504,30 @@ class Message:
         else:
             power_state = GROUP_POWER_STATES.ON
 
-        byte1 = group_number.to_bytes(1, ENDIANNESS)
-        byte2 = (power_state | (control_type << 3) | (target_type << 5)).to_bytes(1, ENDIANNESS)
-        byte3 = target.to_bytes(1, ENDIANNESS)
-        byte4 = (0).to_bytes(1, ENDIANNESS)
-        data  = byte1 + byte2 + byte3 + byte4
+        return _encode_group_control(group_number, power_state, control_type, target_type, target)
+
+    @classmethod
+    def GROUP_CONTROL_REQUEST(cls, group_number: int, power: int = None, control_type: int = GROUP_CONTROL_TYPES.KEEP, target_type: int = GROUP_TARGET_TYPES.KEEP, target: int = 0) -> Message:
+        data = cls.group_control_data(group_number, power, control_type, target_type, target)
+        key = (MSGTYPE_GRP_CTRL, group_number, power is not None, control_type != GROUP_CONTROL_TYPES.KEEP, target_type)
+        return Message(data, MSGTYPE_GRP_CTRL, key=key)
+
+    @classmethod
+    def GROUPS_CONTROL_REQUEST(cls, controls: list[dict[str, Any]]) -> Message:
+        """Control several groups with one frame, each control holds the GROUP_CONTROL_REQUEST arguments."""
+        data = b"".join(cls.group_control_data(**control) for control in controls)
         return Message(data, MSGTYPE_GRP_CTRL)
 
     @classmethod
     def GROUP_STATUS_REQUEST(cls) -> Message:
-        return Message(MSG_NO_DATA, MSGTYPE_GRP_STAT)
+        return Message(MSG_NO_DATA, MSGTYPE_GRP_STAT, key=(MSGTYPE_GRP_STAT,))
 
     @classmethod
     def GROUP_EXTENDED_REQUEST(cls) -> Message:
-        return Message(MSG_EXTENDED_GROUP_DATA, MSGTYPE_EXTENDED, extended=True)
+        return Message(MSG_EXTENDED_GROUP_DATA, MSGTYPE_EXTENDED, extended=True, key=(MSGTYPE_EXTENDED, MSG_EXTENDED_GROUP_DATA))
 
-    @classmethod
-    def AC_CONTROL_REQUEST(cls, unit_number: int, power: int = None, mode: int = AC_MODES.KEEP, fan_speed: int = AC_FAN_SPEEDS.KEEP, target: int = AC_TARGET_KEEP) -> Message:
+    @staticmethod
+    def ac_control_data(unit_number: int, power: int = None, mode: int = AC_MODES.KEEP, fan_speed: int = AC_FAN_SPEEDS.KEEP, target: int = AC_TARGET_KEEP) -> bytes:
         if mode != AC_MODES.KEEP or power:
             power_state = AC_POWER_STATES.ON
         elif power == 0:
@@ -286,17 +535,180 @@ class Message:
         else:
             power_state = AC_POWER_STATES.KEEP
 
-        byte1 = (unit_number | (power_state << 6)).to_bytes(1, ENDIANNESS)
-        byte2 = (fan_speed | (mode << 4)).to_bytes(1, ENDIANNESS)
-        byte3 = (target | (AC_TARGET_TYPES.KEEP << 6)).to_bytes(1, ENDIANNESS)
-        byte4 = (0).to_bytes(1, ENDIANNESS)
-        data  = byte1 + byte2 + byte3 + byte4
+        return _encode_ac_control(power_state, unit_number, mode, fan_speed, AC_TARGET_TYPES.KEEP, target)
+
+    @classmethod
+    def AC_CONTROL_REQUEST(cls, unit_number: int, power: int = None, mode: int = AC_MODES.KEEP, fan_speed: int = AC_FAN_SPEEDS.KEEP, target: int = AC_TARGET_KEEP) -> Message:
+        data = cls.ac_control_data(unit_number, power, mode, fan_speed, target)
+        key = (MSGTYPE_AC_CTRL, unit_number, power is not None, mode != AC_MODES.KEEP, fan_speed != AC_FAN_SPEEDS.KEEP, target != AC_TARGET_KEEP)
+        return Message(data, MSGTYPE_AC_CTRL, key=key)
+
+    @classmethod
+    def ACS_CONTROL_REQUEST(cls, controls: list[dict[str, Any]]) -> Message:
+        """Control several ACs with one frame, each control holds the AC_CONTROL_REQUEST arguments."""
+        data = b"".join(cls.ac_control_data(**control) for control in controls)
         return Message(data, MSGTYPE_AC_CTRL)
 
     @classmethod
     def AC_STATUS_REQUEST(cls) -> Message:
-        return Message(MSG_NO_DATA, MSGTYPE_AC_STAT)
+        return Message(MSG_NO_DATA, MSGTYPE_AC_STAT, key=(MSGTYPE_AC_STAT,))
 
     @classmethod
     def AC_EXTENDED_REQUEST(cls) -> Message:
-        return Message(MSG_EXTENDED_AC_DATA, MSGTYPE_EXTENDED, extended=True)
+        return Message(MSG_EXTENDED_AC_DATA, MSGTYPE_EXTENDED, extended=True, key=(MSGTYPE_EXTENDED, MSG_EXTENDED_AC_DATA))
+
+    @classmethod
+    def AC_ERROR_REQUEST(cls, unit_number: int) -> Message:
+        data = MSG_EXTENDED_ERROR_DATA + bytes([unit_number])
+        return Message(data, MSGTYPE_EXTENDED, extended=True, key=(MSGTYPE_EXTENDED, data))
+
+# requests that differ only in the message id: (type, extended, data)
+CONSTANT_REQUESTS = (
+    (MSGTYPE_GRP_STAT, False, MSG_NO_DATA),
+    (MSGTYPE_AC_STAT, False, MSG_NO_DATA),
+    (MSGTYPE_EXTENDED, True, MSG_EXTENDED_GROUP_DATA),
+    (MSGTYPE_EXTENDED, True, MSG_EXTENDED_AC_DATA),
+)
+
+class FrameBuilder:
+    """Builds the wire bytes of a message, size prefix included.
+
+    Frames of the constant requests are built once into a buffer, only their id byte
+    and CRC are patched. The CRC is computed once per id, continuing from the CRC over
+    the bytes before the id. Other frames are joined from the packed header, the data
+    and the CRC, without an intermediate buffer.
+    """
+    def __init__(self):
+        # CRC over the address bytes, by extended
+        self._address_crcs = {False: crc16(ADDRESS_BYTES), True: crc16(EXTENDED_ADDRESS_BYTES)}
+        # (type, extended, data): frame buffer and view, CRC by message id
+        self._templates = {}
+        for type, extended, data in CONSTANT_REQUESTS:
+            msg = Message(data, type, 0, extended)
+            buffer = bytearray(self._frame(msg))
+            self._templates[(type, extended, data)] = (buffer, memoryview(buffer), [None] * 256)
+
+    def _frame(self, msg: Message) -> bytes:
+        data = msg.data
+        size = len(data)
+        id = msg.id
+        type = msg.type
+        extended = msg.extended
+        # CRC over id, type, size and data, continuing from the address CRC
+        crc = self._address_crcs[extended]
+        table = CRC16_TABLE
+        crc = (crc >> 8) ^ table[(crc ^ id) & 0xFF]
+        crc = (crc >> 8) ^ table[(crc ^ type) & 0xFF]
+        crc = (crc >> 8) ^ table[(crc ^ (size >> 8)) & 0xFF]
+        crc = (crc >> 8) ^ table[(crc ^ size) & 0xFF]
+        for byte in data:
+            crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+        header = FRAME_HEADER.pack(FRAME_HEADER.size + size + FRAME_CRC_SIZE - FRAME_SIZE_PREFIX, HEADER_BYTES,
+                                   EXTENDED_ADDRESS_BYTES if extended else ADDRESS_BYTES, id, type, size)
+        return b"".join((header, data, FRAME_CRC.pack(crc)))
+
+    def build(self, msg: Message) -> bytes:
+        data = msg.data
+        # constant requests have at most 2 bytes of data, control requests always more
+        template = len(data) <= 2 and self._templates.get((msg.type, msg.extended, data))
+        if template:
+            buffer, view, crcs = template
+            id = msg.id
+            buffer[FRAME_ID_OFFSET] = id
+            end = len(buffer) - FRAME_CRC_SIZE
+            crc = crcs[id]
+            if crc is None:
+                crc = crcs[id] = crc16(view[FRAME_ID_OFFSET:end], self._address_crcs[msg.extended])
+            FRAME_CRC.pack_into(buffer, end, crc)
+            return bytes(buffer)
+        if len(data) > FRAME_MAX_DATA_SIZE:
+            raise ValueError("Message data too large: " + str(len(data)) + " bytes")
+        return self._frame(msg)
+
+_frame_builder = FrameBuilder()
+
+class FrameParser:
+    """Buffered frame scanner, resynchronises on the header bytes after corrupt data."""
+    # console replies carry the address bytes reversed, the address byte to check is the second one
+    ADDRESS_INDEX = 3
+    ADDRESSES = (ADDRESS_BYTES[0], EXTENDED_ADDRESS_BYTES[0])
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.crc_errors = 0
+        self.header_errors = 0
+
+    def reset(self) -> None:
+        """Drop a partial frame, e.g. on a new connection. The error counters are kept."""
+        self._buffer.clear()
+
+    def feed(self, data: bytes) -> list[Message]:
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        start = 0
+        while True:
+            sync = buffer.find(HEADER_BYTES, start)
+            if sync < 0:
+                # keep a trailing sync byte, the next chunk may complete the header,
+                # unless it is the last byte of a frame already parsed
+                sync = len(buffer) - 1 if buffer.endswith(HEADER_BYTES[:1]) and len(buffer) > start else len(buffer)
+                if sync > start:
+                    self._skipped(sync - start)
+                start = sync
+                break
+            if sync != start:
+                self._skipped(sync - start)
+            start = sync
+            if len(buffer) - start < FRAME_HEADER_SIZE:
+                break
+            # the size field is only trusted after a valid address, the other address byte is the common 0xb0
+            if buffer[start + self.ADDRESS_INDEX] not in self.ADDRESSES or buffer[start + 5 - self.ADDRESS_INDEX] != ADDRESS_BYTES[1]:
+                _LOGGER.error("Message received with invalid address: " + bytes(buffer[start+2:start+4]).hex())
+                self.header_errors += 1
+                start += 1
+                continue
+            size = int.from_bytes(buffer[start+6:start+8], ENDIANNESS)
+            if size > FRAME_MAX_DATA_SIZE:
+                _LOGGER.error("Message received with invalid size: " + str(size))
+                self.header_errors += 1
+                start += 1
+                continue
+            end = start + FRAME_HEADER_SIZE + size + FRAME_CRC_SIZE
+            if len(buffer) < end:
+                break
+            frame = memoryview(buffer)[start:end]
+            crc = int.from_bytes(frame[-FRAME_CRC_SIZE:], ENDIANNESS)
+            valid = crc == Crc16(frame[2:-FRAME_CRC_SIZE]).value
+            message = valid and self._decode_frame(frame)
+            frame.release()
+            if not valid:
+                _LOGGER.error("Message received has invalid crc!")
+                self.crc_errors += 1
+                start += 1
+                continue
+            start = end
+            if message:
+                messages.append(message)
+        del buffer[:start]
+        return messages
+
+    def _skipped(self, count: int) -> None:
+        _LOGGER.error("Message received with invalid header, skipping " + str(count) + " bytes!")
+        self.header_errors += 1
+
+    def _decode_frame(self, frame: memoryview) -> Message:
+        extended = False
+        if frame[self.ADDRESS_INDEX] == EXTENDED_ADDRESS_BYTES[0]:
+            _LOGGER.debug("Message received with extended header!")
+            extended = True
+        elif frame[self.ADDRESS_INDEX] != ADDRESS_BYTES[0]:
+            _LOGGER.warning("Message received with unknown header: " + str(bytes(frame[2:4])))
+            if len(frame) > FRAME_HEADER_SIZE + FRAME_CRC_SIZE:
+                _LOGGER.warning("Unknown message:")
+                _LOGGER.warning(bytes(frame[FRAME_HEADER_SIZE:-FRAME_CRC_SIZE]))
+            return None
+        else:
+            _LOGGER.debug("Message received with expected header!")
+        data = bytes(frame[FRAME_HEADER_SIZE:-FRAME_CRC_SIZE])
+        return Message(data, frame[5], frame[4], extended)
@@ -0,0 +1,166 @@
+"""Declarative message layouts, compiled into decoders and encoders at import time.
+
+A layout is a tuple of fields. Integer fields read bits (high, low) of the big-endian
+word starting at their byte: bits (7, 6) of byte 0 are its two top bits, bits (15, 5)
+of byte 4 are the top 11 bits of bytes 4 and 5. The decoded value is raw * scale + offset.
+"""
+from __future__ import annotations
+from typing import Any, Callable, NamedTuple
+
+INT = "int"
+TEXT = "text"
+FLAGS = "flags"
+
+class Field(NamedTuple):
+    name: str
+    byte: int
+    bits: tuple[int, int] = (7, 0)
+    scale: float = 1
+    offset: int = 0
+    kind: str = INT
+    # TEXT only: the length in bytes, or the name of the field holding it
+    size: int | str = 0
+
+def Text(name: str, byte: int, size: int | str) -> Field:
+    """A NUL padded UTF-8 string."""
+    return Field(name, byte, kind=TEXT, size=size)
+
+def Flags(name: str, byte: int, bits: tuple[int, int]) -> Field:
+    """One bool per bit, keyed by the bit number."""
+    return Field(name, byte, bits, kind=FLAGS)
+
+def layout_size(layout: tuple[Field, ...]) -> int:
+    """Bytes covered by the fixed size fields of a layout."""
+    return max(field.byte + (field.size if field.kind == TEXT else field.bits[0] // 8 + 1)
+               for field in layout if not isinstance(field.size, str))
+
+def _variable(field: Field) -> str:
+    return field.name.lstrip("_")
+
+def _read(field: Field) -> str:
+    # expression for the raw bits of an integer field, from data at offset
+    high, low = field.bits
+    count = high // 8 + 1
+    terms = [f"data[offset + {field.byte + index}]" + (f" << {8 * (count - 1 - index)}" if index < count - 1 else "")
+             for index in range(count)]
+    expr = terms[0] if count == 1 else "(" + " | ".join(terms) + ")"
+    if low:
+        expr = f"({expr} >> {low})"
+    if high - low + 1 < 8 * count:
+        expr = f"({expr} & {hex((1 << (high - low + 1)) - 1)})"
+    return expr
+
+def _value(field: Field, fields: dict[str, Field]) -> str:
+    if field.kind == TEXT:
+        if isinstance(field.size, str):
+            end = f"offset + {field.byte} + {_variable(fields[field.size])}"
+        else:
+            end = f"offset + {field.byte + field.size}"
+        return f"data[offset + {field.byte}:{end}].decode('utf-8').rstrip('\\x00')"
+    if field.kind == FLAGS:
+        high, low = field.bits
+        return "{" + ", ".join(f"{bit}: bool(data[offset + {field.byte}] & {hex(1 << bit)})"
+                               for bit in range(high, low - 1, -1)) + "}"
+    expr = _read(field)
+    if field.scale != 1:
+        expr = f"{expr} * {field.scale!r}"
+    if field.offset:
+        expr = f"{expr} + {field.offset}" if field.offset > 0 else f"{expr} - {-field.offset}"
+    return expr
+
+def _compile(source: str, name: str) -> Callable:
+    namespace = {}
+    exec(compile(source, "<layout " + name + ">", "exec"), namespace)
+    return namespace[name]
+
+def _values(layout: tuple[Field, ...]) -> list[str]:
+    fields = {field.name: field for field in layout}
+    return [f"    {_variable(field)} = {_value(field, fields)}" for field in layout]
+
+def _dict(layout: tuple[Field, ...]) -> str:
+    return "{" + ", ".join(f"{field.name!r}: {_variable(field)}" for field in layout) + "}"
+
+def _tuple(layout: tuple[Field, ...]) -> str:
+    return "(" + ", ".join(_variable(field) for field in layout) + ",)"
+
+def _iter(layout: tuple[Field, ...], size: int, result: str) -> Callable[[bytes, int, int], list]:
+    # one loop over all the records, instead of a call per record
+    lines = [f"def iter_decode(data, offset=0, stride={size}):",
+             "    results = []",
+             "    append = results.append",
+             f"    for offset in range(offset, len(data) - {size} + 1, stride):",
+             *["    " + line for line in _values(layout)],
+             f"        append({result})",
+             "    return results"]
+    return _compile("\n".join(lines), "iter_decode")
+
+def compile_unpacker(layout: tuple[Field, ...]) -> Callable[[bytes, int], tuple]:
+    """Compile a layout into unpack(data, offset=0) -> tuple of field values in layout order."""
+    lines = ["def unpack(data, offset=0):", *_values(layout), "    return " + _tuple(layout)]
+    return _compile("\n".join(lines), "unpack")
+
+def compile_iter_decoder(layout: tuple[Field, ...], size: int) -> Callable[[bytes, int, int], list[dict[str, Any]]]:
+    """Compile a layout into iter_decode(data, offset=0, stride=size) -> a dict of field values
+    for every complete record from offset on."""
+    return _iter(layout, size, _dict(layout))
+
+def compile_iter_unpacker(layout: tuple[Field, ...], size: int) -> Callable[[bytes, int, int], list[tuple]]:
+    """Like compile_iter_decoder, with a tuple of field values in layout order for every record."""
+    return _iter(layout, size, _tuple(layout))
+
+def compile_record_decoder(layout: tuple[Field, ...], size: int) -> Callable[[Any, bytes, int], bool]:
+    """Compile a layout into a decode(self, data, offset=0) method that writes the fields to the
+    record attributes of the same names, returns True if anything changed."""
+    lines = ["def decode(self, data, offset=0):",
+             '    """Decode a status chunk straight into this record, returns True if anything changed."""',
+             *_values(layout)]
+    lines.append(f"    self._raw = data[offset:offset + {size}]")
+    lines.append("    if (" + "\n            and ".join(f"self.{field.name} == {_variable(field)}" for field in layout) + "):")
+    lines.append("        return False")
+    lines += [f"    self.{field.name} = {_variable(field)}" for field in layout]
+    lines.append("    self._log_updated()")
+    lines.append("    return True")
+    return _compile("\n".join(lines), "decode")
+
+def compile_record_loader(layout: tuple[Field, ...], size: int) -> Callable[[Any, bytes, int], None]:
+    """Compile a layout into a _load(self, data, offset=0) method that sets the record attributes
+    without comparing, for records that were just created."""
+    lines = ["def _load(self, data, offset=0):", *_values(layout)]
+    lines.append(f"    self._raw = data[offset:offset + {size}]")
+    lines += [f"    self.{field.name} = {_variable(field)}" for field in layout]
+    return _compile("\n".join(lines), "_load")
+
+def field_mask(layout: tuple[Field, ...], size: int) -> int:
+    """Mask of the bits covered by the fields of a layout, over the big-endian int of a size byte chunk."""
+    mask = 0
+    for field in layout:
+        if field.kind == TEXT:
+            if isinstance(field.size, str):
+                raise ValueError("Variable size field " + field.name + " has no fixed mask")
+            high, low = 8 * field.size - 1, 0
+        else:
+            high, low = field.bits
+        top = field.byte + high // 8
+        mask |= ((1 << (high - low + 1)) - 1) << (low + 8 * (size - 1 - top))
+    return mask
+
+def compile_encoder(layout: tuple[Field, ...], size: int) -> Callable[..., bytes]:
+    """Compile a layout of integer fields into encode(*values) -> bytes, taking the values in
+    layout order. Bytes not covered by a field are 0."""
+    parts = [[] for _ in range(size)]
+    for field in layout:
+        high, low = field.bits
+        count = high // 8 + 1
+        raw = _variable(field)
+        if field.offset:
+            raw = f"({raw} - {field.offset})"
+        if field.scale != 1:
+            raw = f"round({raw} / {field.scale!r})"
+        for index in range(count):
+            # the field sits at bits (high, low) of the word, this byte holds word bits 8 * (count - 1 - index) upwards
+            shift = low - 8 * (count - 1 - index)
+            term = f"{raw} << {shift}" if shift > 0 else f"{raw} >> {-shift}" if shift < 0 else raw
+            parts[field.byte + index].append(term if count == 1 else f"(({term}) & 0xff)")
+    lines = ["def encode(" + ", ".join(_variable(field) for field in layout) + "):"]
+    lines.append("    return bytes((" + ", ".join(" | ".join(terms) if terms else "0" for terms in parts) + ",))")
+    return _compile("\n".join(lines), "encode")
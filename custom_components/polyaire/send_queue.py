@@ -0,0 +1,127 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from .protocol import *
+
+if TYPE_CHECKING:
+    from .metrics import Metrics
+
+import logging
+_LOGGER = logging.getLogger(__name__)
+
+class SEND_LANES(SimpleNamespace):
+    INTERACTIVE = 0
+    STATUS = 1
+    INFO = 2
+
+SEND_LANE_NAMES = {
+    SEND_LANES.INTERACTIVE: "interactive",
+    SEND_LANES.STATUS: "status",
+    SEND_LANES.INFO: "info",
+}
+
+# lane by message type: user commands, status polls and heartbeats, extended info refreshes
+SEND_LANE_BY_TYPE = {
+    MSGTYPE_GRP_CTRL: SEND_LANES.INTERACTIVE,
+    MSGTYPE_AC_CTRL: SEND_LANES.INTERACTIVE,
+    MSGTYPE_GRP_STAT: SEND_LANES.STATUS,
+    MSGTYPE_AC_STAT: SEND_LANES.STATUS,
+    MSGTYPE_EXTENDED: SEND_LANES.INFO,
+}
+
+# seconds a message may wait behind higher lanes before it is sent first
+SEND_LANE_MAX_WAIT = {
+    SEND_LANES.STATUS: 1.0,
+    SEND_LANES.INFO: 3.0,
+}
+
+class SendQueue:
+    """Outbound message queue with priority lanes, a message replaces the queued message with the same key in place.
+
+    Interactive commands are sent before status polls, status polls before info
+    refreshes. A message that waited longer than its lane's SEND_LANE_MAX_WAIT
+    is sent before the higher lanes, so a burst of commands cannot starve the polls.
+    """
+    def __init__(self, metrics: Metrics):
+        self._metrics = metrics
+        # per lane, in priority order: key -> (message, monotonic time it was queued)
+        self._lanes: list[dict[Any, tuple[Message, float]]] = [{} for _ in SEND_LANE_NAMES]
+        self._available = asyncio.Event()
+
+    def _key(self, msg: Message) -> Any:
+        return msg if msg.key is None else msg.key
+
+    def _lane(self, msg: Message) -> dict[Any, tuple[Message, float]]:
+        return self._lanes[SEND_LANE_BY_TYPE.get(msg.type, SEND_LANES.STATUS)]
+
+    def qsize(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def empty(self) -> bool:
+        return not any(self._lanes)
+
+    def put_nowait(self, msg: Message) -> Message | None:
+        """Queue msg, returns the older message it replaced, if any."""
+        key = self._key(msg)
+        lane = self._lane(msg)
+        superseded = lane.get(key)
+        # a replacing message keeps its place in the lane, and the time it was first queued
+        lane[key] = (msg, superseded[1] if superseded else time.monotonic())
+        self._available.set()
+        if superseded:
+            _LOGGER.debug("Message " + str(superseded[0].id) + " replaced by newer message " + str(msg.id))
+            return superseded[0]
+        return None
+
+    def requeue(self, msg: Message) -> None:
+        """Put msg back at the front of its lane, unless a newer message replaced it meanwhile."""
+        key = self._key(msg)
+        lane = self._lane(msg)
+        if key in lane:
+            return
+        entries = {key: (msg, time.monotonic()), **lane}
+        lane.clear()
+        lane.update(entries)
+        self._available.set()
+
+    def discard(self, msg: Message) -> None:
+        """Remove msg if it is still queued."""
+        key = self._key(msg)
+        lane = self._lane(msg)
+        if key in lane and lane[key][0] is msg:
+            del lane[key]
+
+    def _pop(self, now: float) -> Message:
+        lanes = self._lanes
+        # the lower lanes first when their oldest message waited too long
+        for index, max_wait in SEND_LANE_MAX_WAIT.items():
+            lane = lanes[index]
+            if lane and now - next(iter(lane.values()))[1] >= max_wait:
+                self._metrics.counters["lane_promotions"] += 1
+                break
+        else:
+            index = next(index for index, lane in enumerate(lanes) if lane)
+            lane = lanes[index]
+        msg, queued = lane.pop(next(iter(lane)))
+        self._metrics.queue_time[index].observe(now - queued)
+        return msg
+
+    async def wait(self) -> None:
+        """Wait until a message is queued."""
+        while self.empty():
+            self._available.clear()
+            await self._available.wait()
+
+    async def get(self) -> Message:
+        await self.wait()
+        return self._pop(time.monotonic())
+
+    async def get_batch(self, max_count: int) -> list[Message]:
+        """Wait for a message, then take up to max_count queued messages in priority order."""
+        await self.wait()
+        now = time.monotonic()
+        return [self._pop(now) for _ in range(min(max_count, self.qsize()))]
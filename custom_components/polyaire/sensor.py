@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.const import PERCENTAGE, EntityCategory, UnitOfTime
+
+from .const import DOMAIN
+from .send_queue import SEND_LANE_NAMES
+
+import logging
+_LOGGER = logging.getLogger(__name__)
+
+# metrics change with every frame, poll them instead of writing the state on every update
+SCAN_INTERVAL = timedelta(seconds=60)
+
+async def async_setup_entry(hass, config_entry, async_add_devices):
+    """Set up the AirTouch 4 diagnostic sensor entities, disabled by default."""
+    _LOGGER.debug("Setting up AirTouch diagnostic sensor entities...")
+    airtouch = hass.data[DOMAIN][config_entry.entry_id]
+    metrics = airtouch.metrics
+
+    async_add_devices([
+        AirTouchCounterSensor(airtouch, "frames_received", "Frames Received", lambda: sum(metrics.frames_received.values())),
+        AirTouchCounterSensor(airtouch, "frames_sent", "Frames Sent", lambda: sum(metrics.frames_sent.values())),
+        AirTouchCounterSensor(airtouch, "bytes_received", "Bytes Received", lambda: metrics.counters["bytes_received"]),
+        AirTouchCounterSensor(airtouch, "bytes_sent", "Bytes Sent", lambda: metrics.counters["bytes_sent"]),
+        AirTouchCounterSensor(airtouch, "crc_errors", "CRC Errors", lambda: metrics.crc_errors),
+        AirTouchCounterSensor(airtouch, "header_errors", "Header Errors", lambda: metrics.header_errors),
+        AirTouchCounterSensor(airtouch, "reconnects", "Reconnects", lambda: metrics.counters["reconnects"]),
+        AirTouchQueueDepthSensor(airtouch),
+        AirTouchGaugeSensor(airtouch, "frames_per_second", "Frames Per Second", lambda: metrics.frames_per_second, "frames/s"),
+        AirTouchGaugeSensor(airtouch, "drop_rate", "Drop Rate", lambda: _percent(metrics.drop_rate), PERCENTAGE),
+        AirTouchTimingSensor(airtouch, "round_trip_time", "Command Round-Trip Time", metrics.round_trip_time),
+        AirTouchTimingSensor(airtouch, "dispatch_time", "Dispatch Time", metrics.dispatch_time),
+        *[AirTouchTimingSensor(airtouch, "queue_time_" + name, name.capitalize() + " Queue Time", metrics.queue_time[lane])
+          for lane, name in SEND_LANE_NAMES.items()],
+    ])
+
+class AirTouchMetricSensor(SensorEntity):
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, airtouch, key, name):
+        self._airtouch = airtouch
+        self._key = key
+        self._name = name
+        _LOGGER.debug("Metric " + key + ": created")
+
+    @property
+    def name(self):
+        """Return the name for this device."""
+        return "AirTouch " + self._name
+
+    @property
+    def should_poll(self):
+        """Return the polling state."""
+        return True
+
+    @property
+    def unique_id(self):
+        """Return unique ID for this device."""
+        return "polyaire_metric_" + self._key
+
+class AirTouchCounterSensor(AirTouchMetricSensor):
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, airtouch, key, name, value):
+        super().__init__(airtouch, key, name)
+        self._value = value
+
+    @property
+    def native_value(self):
+        """Return the counter value."""
+        return self._value()
+
+class AirTouchGaugeSensor(AirTouchMetricSensor):
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_suggested_display_precision = 1
+
+    def __init__(self, airtouch, key, name, value, unit):
+        super().__init__(airtouch, key, name)
+        self._value = value
+        self._attr_native_unit_of_measurement = unit
+
+    @property
+    def native_value(self):
+        """Return the current value."""
+        return self._value()
+
+class AirTouchQueueDepthSensor(AirTouchMetricSensor):
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(self, airtouch):
+        super().__init__(airtouch, "send_queue_depth", "Send Queue Depth")
+
+    @property
+    def native_value(self):
+        """Return the number of messages waiting to be sent."""
+        return self._airtouch.metrics.gauges["send_queue_depth"]
+
+    @property
+    def extra_state_attributes(self):
+        """Return the queue depth distribution."""
+        histogram = self._airtouch.metrics.send_queue_depth
+        return {"p95": histogram.percentile(95), "max": histogram.max}
+
+class AirTouchTimingSensor(AirTouchMetricSensor):
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+    _attr_suggested_display_precision = 1
+
+    def __init__(self, airtouch, key, name, histogram):
+        super().__init__(airtouch, key, name)
+        self._histogram = histogram
+
+    @property
+    def native_value(self):
+        """Return the mean time in milliseconds."""
+        mean = self._histogram.mean
+        return None if mean is None else mean * 1000
+
+    @property
+    def extra_state_attributes(self):
+        """Return the time distribution in milliseconds."""
+        histogram = self._histogram
+        return {
+            "count": histogram.count,
+            "p50": _milliseconds(histogram.percentile(50)),
+            "p95": _milliseconds(histogram.percentile(95)),
+            "max": _milliseconds(histogram.max),
+        }
+
+def _milliseconds(seconds):
+    return None if seconds is None else seconds * 1000
+
+def _percent(ratio):
+    return None if ratio is None else ratio * 100
@@ -0,0 +1,23 @@
+"""Test setup: the integration modules are imported without Home Assistant, like the tools do,
+and coroutine tests are run in a fresh event loop."""
+import asyncio
+import inspect
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tools"))
+
+import _polyaire  # noqa: E402,F401
+
+# seconds before a hung coroutine test fails
+TEST_TIMEOUT = 30
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_pyfunc_call(pyfuncitem):
+    if not inspect.iscoroutinefunction(pyfuncitem.obj):
+        return None
+    kwargs = {name: pyfuncitem.funcargs[name] for name in pyfuncitem._fixtureinfo.argnames}
+    asyncio.run(asyncio.wait_for(pyfuncitem.obj(**kwargs), TEST_TIMEOUT))
+    return True
@@ -0,0 +1,192 @@
+"""The hub driven against the console simulator."""
+import asyncio
+import json
+
+import pytest
+
+from polyaire import airtouch4
+from polyaire.airtouch4 import AirTouch4
+from polyaire.capture import CAPTURE_RECEIVED, CAPTURE_SENT, Capture, read_capture
+from polyaire.protocol import *
+
+from simulator import Console
+
+async def connect(console: Console, **kwargs) -> tuple[AirTouch4, int]:
+    port = await console.start(port=0)
+    airtouch = AirTouch4("127.0.0.1", port, **kwargs)
+    await asyncio.wait_for(airtouch.ready(), 5)
+    return airtouch, port
+
+async def until(condition, timeout: float) -> None:
+    # reconnects back off for seconds, poll instead of sleeping for the worst case
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.05)
+    await asyncio.wait_for(poll(), timeout)
+
+async def close(airtouch: AirTouch4, console: Console) -> None:
+    await airtouch.disconnect()
+    await console.stop()
+
+async def test_handshake_reads_topology_and_state():
+    console = Console(acs=2, groups=6)
+    airtouch, _ = await connect(console)
+    assert sorted(airtouch.groups) == list(range(6))
+    assert sorted(airtouch.acs) == [0, 1]
+    assert airtouch.groups_info[3] == "Zone 3"
+    assert [group.group_number for group in airtouch.get_ac_groups(1)] == [3, 4, 5]
+    await close(airtouch, console)
+
+async def test_commands_reach_the_console():
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    await airtouch.request_group_open_perc(1, 82)
+    await airtouch.request_group_target_temp(2, 25)
+    await airtouch.request_ac_hvac_mode(0, AC_MODES.HEAT)
+    assert console.groups[1].open_perc == 80
+    assert console.groups[2].target == 25
+    assert console.acs[0].mode == AC_MODES.HEAT
+    assert airtouch.get_group(1).group_open_perc == 80
+    await close(airtouch, console)
+
+async def test_ac_error_info_is_requested_by_unit():
+    console = Console(acs=2, groups=4)
+    console.acs[1].error_code = 0x0104
+    console.acs[1].error_info = "Outdoor unit fault"
+    airtouch, _ = await connect(console)
+    assert airtouch.acs[1].ac_error_code == 0x0104
+    await airtouch.request_ac_error_info(1)
+    assert airtouch.acs_error_info == {1: "Outdoor unit fault"}
+    await close(airtouch, console)
+
+async def test_capture_records_the_traffic_in_order(tmp_path):
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    path = str(tmp_path / "airtouch.cap")
+    await airtouch.start_capture(await asyncio.get_running_loop().run_in_executor(None, Capture, path))
+    for percentage in (20, 40, 60):
+        await airtouch.request_group_open_perc(1, percentage)
+    await airtouch.stop_capture()
+    records = list(read_capture(path))
+    sent = [data for direction, _, data in records if direction == CAPTURE_SENT]
+    assert len(sent) == 3
+    assert [direction for direction, _, _ in records].count(CAPTURE_RECEIVED) >= 3
+    assert [timestamp for _, timestamp, _ in records] == sorted(timestamp for _, timestamp, _ in records)
+    await close(airtouch, console)
+
+async def test_queued_commands_for_the_same_field_are_coalesced():
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    requests = console.requests
+    await asyncio.gather(airtouch.request_group_open_perc(1, 20), airtouch.request_group_open_perc(1, 70))
+    assert console.requests == requests + 1
+    assert console.groups[1].open_perc == 70
+    assert airtouch.metrics.counters["commands_coalesced"] == 1
+    await close(airtouch, console)
+
+async def test_commands_without_effect_are_dropped():
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    requests = console.requests
+    assert await airtouch.request_group_open_perc(1, 50) is None
+    assert console.requests == requests
+    assert airtouch.metrics.counters["commands_dropped"] == 1
+    await close(airtouch, console)
+
+async def test_dropped_requests_are_paced_and_sent_again():
+    console = Console(acs=1, groups=8, min_gap=0.03)
+    airtouch, _ = await connect(console)
+    await asyncio.gather(*[airtouch.request_group_open_perc(group, 10 * group) for group in range(1, 8)])
+    assert [console.groups[group].open_perc for group in range(1, 8)] == [10 * group for group in range(1, 8)]
+    assert console.dropped > 0
+    assert airtouch.metrics.counters["requests_dropped"] > 0
+    assert airtouch._pacer.gap > 0
+    await close(airtouch, console)
+
+async def test_slow_console_is_not_flooded():
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    console.latency = 1.2
+    requests = console.requests
+    await airtouch.request_group_status()
+    # a late duplicate reply to a retransmitted request is not a pushed update
+    await asyncio.sleep(1.5)
+    assert console.requests - requests <= 2
+    assert airtouch.metrics.counters["group_status_pushed"] == 0
+    assert airtouch._scheduler.workaround
+    await close(airtouch, console)
+
+async def test_group_status_workaround_follows_pushes():
+    console = Console(acs=1, groups=4, push_interval=0.1)
+    airtouch, _ = await connect(console, poll_interval=0.4)
+    await asyncio.sleep(0.35)
+    assert not airtouch._scheduler.workaround
+    console.push = lambda: None
+    await asyncio.sleep(1)
+    assert airtouch._scheduler.workaround
+    await close(airtouch, console)
+
+async def test_optimistic_state_is_shown_then_confirmed():
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    group = airtouch.get_group(2)
+    seen = []
+    group.register_callback(lambda: seen.append(group.group_target))
+    command = asyncio.create_task(airtouch.request_group_target_temp(2, 25))
+    await asyncio.sleep(0)
+    assert group.group_target == 25 and group.optimistic == {"group_target": 25}
+    await command
+    assert seen[0] == 25
+    assert not group.optimistic
+    await close(airtouch, console)
+
+async def test_unconfirmed_optimistic_state_is_rolled_back(monkeypatch):
+    monkeypatch.setattr(airtouch4, "OPTIMISTIC_TIMEOUT", 0.3)
+    console = Console(acs=1, groups=4)
+    airtouch, _ = await connect(console)
+    console.groups[3].control = lambda record: None
+    group = airtouch.get_group(3)
+    await airtouch.request_group_open_perc(3, 80)
+    assert group.group_open_perc == 80
+    await asyncio.sleep(0.5)
+    assert group.group_open_perc == 50 and not group.optimistic
+    assert airtouch.metrics.counters["optimistic_rollbacks"] == 1
+    await close(airtouch, console)
+
+async def test_timed_out_command_is_not_sent_after_reconnect():
+    console = Console(acs=1, groups=4)
+    airtouch, port = await connect(console)
+    await console.stop()
+    with pytest.raises(asyncio.TimeoutError):
+        await airtouch.request_ac_power(0, 0)
+    await console.start(port=port)
+    await until(lambda: airtouch.connected, 10)
+    await airtouch.request_ac_status()
+    assert console.acs[0].power_state == 1
+    await close(airtouch, console)
+
+async def test_pending_request_is_sent_again_after_reconnect():
+    console = Console(acs=1, groups=4)
+    airtouch, port = await connect(console)
+    await console.stop()
+    command = asyncio.create_task(airtouch.request_group_open_perc(0, 30))
+    await asyncio.sleep(0.2)
+    await console.start(port=port)
+    await command
+    assert console.groups[0].open_perc == 30
+    assert airtouch.metrics.counters["reconnects"] >= 1
+    await close(airtouch, console)
+
+async def test_snapshot_restore_refreshes_from_the_console():
+    console = Console(acs=1, groups=4)
+    airtouch, port = await connect(console)
+    snapshot = json.loads(json.dumps(airtouch.snapshot()))
+    await close(airtouch, console)
+    console.groups[1].open_perc = 90
+    restored = AirTouch4("127.0.0.1", port)
+    assert restored.restore(snapshot)
+    assert restored.get_group(1).group_open_perc == 50
+    await asyncio.wait_for(restored.ready(), 1)
+    await console.start(port=port)
+    await until(lambda: restored.get_group(1).group_open_perc == 90, 10)
+    await close(restored, console)
@@ -0,0 +1,94 @@
+from polyaire.protocol import *
+
+from benchmark import ac_status_data, encode_concat, group_status_data
+
+def reply_frame(data: bytes, type: int, id: int = 1) -> bytes:
+    # console replies carry the address bytes reversed
+    payload = bytes([0xb0, 0x80, id, type]) + len(data).to_bytes(2, ENDIANNESS) + data
+    return HEADER_BYTES + payload + crc16(payload).to_bytes(2, ENDIANNESS)
+
+def test_crc16_modbus():
+    assert crc16(b"123456789") == 0x4B37
+    assert crc16(b"56789", crc16(b"1234")) == 0x4B37
+    assert Crc16(b"1234").update(memoryview(b"56789")).value == 0x4B37
+
+def test_parser_resynchronises_after_garbage():
+    parser = FrameParser()
+    frame = reply_frame(group_status_data(4), MSGTYPE_GRP_STAT)
+    messages = parser.feed(b"\x01\x55\x02" + frame)
+    assert [msg.data for msg in messages] == [group_status_data(4)]
+    assert parser.header_errors == 1
+
+def test_parser_handles_frames_split_at_every_byte():
+    parser = FrameParser()
+    frames = reply_frame(group_status_data(4), MSGTYPE_GRP_STAT, 1) + reply_frame(ac_status_data(2), MSGTYPE_AC_STAT, 2)
+    messages = [msg for byte in frames for msg in parser.feed(bytes([byte]))]
+    assert [(msg.id, msg.type) for msg in messages] == [(1, MSGTYPE_GRP_STAT), (2, MSGTYPE_AC_STAT)]
+    assert parser.header_errors == parser.crc_errors == 0
+
+def test_parser_rejects_corrupt_crc():
+    parser = FrameParser()
+    frame = bytearray(reply_frame(ac_status_data(1), MSGTYPE_AC_STAT))
+    frame[10] ^= 0xff
+    assert parser.feed(bytes(frame) + reply_frame(ac_status_data(1), MSGTYPE_AC_STAT, 2))[0].id == 2
+    assert parser.crc_errors == 1
+
+def test_parser_does_not_wait_for_a_corrupt_size():
+    parser = FrameParser()
+    corrupt = [HEADER_BYTES + bytes([0xb0, 0x80, 1, MSGTYPE_AC_STAT]) + (1000).to_bytes(2, ENDIANNESS),
+               HEADER_BYTES + bytes([0x12, 0x34, 1, MSGTYPE_AC_STAT]) + (200).to_bytes(2, ENDIANNESS)]
+    valid = b"".join(reply_frame(ac_status_data(2), MSGTYPE_AC_STAT, id) for id in range(1, 41))
+    for header in corrupt:
+        assert len(parser.feed(header + valid)) == 40
+
+def test_parser_accepts_the_longest_ac_error():
+    data = MSG_EXTENDED_ERROR_DATA + bytes([1, 255]) + b"E" * 255
+    payload = EXTENDED_ADDRESS_BYTES[::-1] + bytes([1, MSGTYPE_EXTENDED]) + len(data).to_bytes(2, ENDIANNESS) + data
+    messages = FrameParser().feed(HEADER_BYTES + payload + crc16(payload).to_bytes(2, ENDIANNESS))
+    assert messages[0].decode_ac_error_info() == {1: "E" * 255}
+
+def test_parser_does_not_reuse_a_trailing_crc_byte():
+    # a chunk ending with a frame whose CRC ends in the first sync byte
+    id = next(id for id in range(1, 256) if reply_frame(ac_status_data(1), MSGTYPE_AC_STAT, id)[-1] == HEADER_BYTES[0])
+    parser = FrameParser()
+    parser.feed(reply_frame(ac_status_data(1), MSGTYPE_AC_STAT, id))
+    assert len(parser.feed(reply_frame(ac_status_data(1), MSGTYPE_AC_STAT, 2))) == 1
+    assert parser.header_errors == 0
+
+def test_frame_builder_matches_concatenated_frames():
+    builder = FrameBuilder()
+    for msg in (Message.GROUP_STATUS_REQUEST(), Message.AC_EXTENDED_REQUEST(), Message.AC_ERROR_REQUEST(1),
+                Message.GROUP_CONTROL_REQUEST(3, power=1), Message.AC_CONTROL_REQUEST(0, mode=AC_MODES.COOL, target=22),
+                Message.GROUPS_CONTROL_REQUEST([dict(group_number=group, power=1) for group in range(16)])):
+        assert builder.build(msg) == b"".join(encode_concat(msg))
+        # templates are patched per message id
+        assert builder.build(msg) == b"".join(encode_concat(msg))
+
+def test_record_decode_reports_changes():
+    data = group_status_data(2)
+    group = AirTouchGroupStatus.from_bytes(data, 0)
+    assert (group.group_number, group.group_open_perc, group.group_target) == (0, 50, 21.0)
+    assert group.matches(data, 0)
+    assert not group.decode(data, 0)
+    changed = bytes([data[0], data[1] - 10]) + data[2:6]
+    assert not group.matches(changed, 0)
+    assert group.decode(changed, 0)
+    assert group.group_open_perc == 40
+
+def test_optimistic_fields_confirm_and_expire():
+    data = group_status_data(1)
+    group = AirTouchGroupStatus.from_bytes(data, 0)
+    assert group.set_optimistic({"group_open_perc": 80}, deadline=10)
+    assert group.group_open_perc == 80 and not group.matches(data, 0)
+    # a status that predates the command keeps the optimistic value
+    group.decode(data, 0)
+    group.confirm_optimistic()
+    assert group.group_open_perc == 80 and group.optimistic == {"group_open_perc": 80}
+    assert group.expire_optimistic(now=5) == []
+    assert group.expire_optimistic(now=10) == ["group_open_perc"]
+    assert group.group_open_perc == 50 and not group.optimistic
+    # confirmed by the status
+    group.set_optimistic({"group_open_perc": 40}, deadline=10)
+    group.decode(bytes([data[0], 0x80 | 40]) + data[2:], 0)
+    group.confirm_optimistic()
+    assert group.group_open_perc == 40 and not group.optimistic
@@ -0,0 +1,15 @@
+"""Import the polyaire integration modules without Home Assistant installed.
+
+The package __init__ pulls in Home Assistant, but the protocol and hub modules
+only need the standard library, so register a bare package and import those.
+"""
+import os
+import sys
+import types
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components", "polyaire")
+
+if "polyaire" not in sys.modules:
+    package = types.ModuleType("polyaire")
+    package.__path__ = [PACKAGE_DIR]
+    sys.modules["polyaire"] = package
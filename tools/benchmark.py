@@ -0,0 +1,389 @@
+"""Microbenchmarks for the AirTouch 4 protocol hot paths.
+
+Usage: python tools/benchmark.py [crc16 parser records frames scene codec]
+
+The codec suite times the encoders and decoders for every payload size (1-16
+groups, 1-4 ACs). Save its results as a baseline on the target machine (e.g. a
+Raspberry Pi) with --save, later runs given --baseline exit with status 1 when
+a benchmark is more than --threshold percent slower than the baseline. Timings
+are compared relative to a pure Python calibration loop timed alongside each
+benchmark, so CPU frequency scaling does not read as a regression. Repeated runs
+of unchanged code stay within about 15% of each other, keep --threshold above
+that.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+
+import _polyaire  # noqa: F401
+from polyaire.airtouch4 import AirTouch4
+from polyaire.protocol import *
+
+from simulator import Console
+
+def crc16_bitwise(data: bytes) -> int:
+    # reference: the original bit-by-bit implementation
+    crc = 0xFFFF
+    for byte in data:
+        crc = crc ^ byte
+        for _ in range(8):
+            odd = crc & 0x0001
+            crc = crc >> 1
+            if odd: crc = crc ^ 0xA001
+    return crc
+
+def decode_groups_namespace(data: bytes) -> dict[int, SimpleNamespace]:
+    # reference: the original SimpleNamespace based group status decoder
+    groups = dict()
+    for group in [data[i:i+6] for i in range(0, len(data), 6)]:
+        group_number = group[0] & 0b00111111
+        groups[group_number] = SimpleNamespace(
+            group_power_state = (group[0] & 0b11000000) >> 6,
+            group_number = group_number,
+            group_control_type = (group[1] & 0b10000000) >> 7,
+            group_open_perc = group[1] & 0b01111111,
+            group_battery_low = (group[2] & 0b10000000) >> 7,
+            group_has_turbo = (group[2] & 0b01000000) >> 6,
+            group_target = (group[2] & 0b00111111) * 1.0,
+            group_has_sensor = (group[3] & 0b10000000) >> 7,
+            group_temp = (((group[4] << 3) + ((group[5] & 0b11100000) >> 5)) - 500) / 10,
+            group_has_spill = (group[5] & 0b00010000) >> 4
+        )
+    return groups
+
+def update_namespace(record: SimpleNamespace, status: dict) -> bool:
+    # reference: the original Updateable.update
+    updated = False
+    for key, value in status.items():
+        if hasattr(record, key) and type(value) is not set and getattr(record, key) != value:
+            setattr(record, key, value)
+            updated = True
+    return updated
+
+def encode_concat(msg: Message) -> tuple[bytes, bytes]:
+    # reference: the original Message.encode, built by concatenation
+    size_bytes = len(msg.data).to_bytes(2, ENDIANNESS)
+    address = EXTENDED_ADDRESS_BYTES if msg.extended else ADDRESS_BYTES
+    payload = address + bytes([msg.id, msg.type]) + size_bytes + msg.data
+    crc = crc16(payload)
+    crc_bytes = crc.to_bytes(2, ENDIANNESS)
+    message = HEADER_BYTES + payload + crc_bytes
+    return len(message).to_bytes(4, ENDIANNESS), message
+
+def group_status_data(groups: int) -> bytes:
+    data = bytearray()
+    for group in range(groups):
+        temp = 500 + 215 + group
+        data += bytes([0xc0 | group, 0x80 | 50, 0x40 | 21, 0x80, temp >> 3, (temp & 0b111) << 5])
+    return bytes(data)
+
+def ac_status_data(acs: int) -> bytes:
+    data = bytearray()
+    for ac in range(acs):
+        temp = 500 + 230 + ac
+        data += bytes([0x40 | ac, 0x42, 22, 0, temp >> 3, (temp & 0b111) << 5, 0, 0])
+    return bytes(data)
+
+def group_info_data(groups: int) -> bytes:
+    data = bytearray(MSG_EXTENDED_GROUP_DATA)
+    for group in range(groups):
+        data += bytes([group]) + ("Zone " + str(group)).encode("utf-8").ljust(8, b"\x00")
+    return bytes(data)
+
+def ac_info_data(acs: int) -> bytes:
+    data = bytearray(MSG_EXTENDED_AC_DATA)
+    for ac in range(acs):
+        data += (bytes([ac, 0]) + ("AC " + str(ac)).encode("utf-8").ljust(16, b"\x00")
+                 + bytes([ac * 4, 4, 0b00011111, 0b00011101, 16, 30]))
+    return bytes(data)
+
+def frame(data: bytes, type: int) -> bytes:
+    # bytes covered by the crc: address, id, type, size, data
+    return ADDRESS_BYTES + bytes([1, type]) + len(data).to_bytes(2, ENDIANNESS) + data
+
+def received_frame(data: bytes, type: int) -> bytes:
+    # console replies carry the address bytes reversed
+    payload = bytes(reversed(ADDRESS_BYTES)) + bytes([1, type]) + len(data).to_bytes(2, ENDIANNESS) + data
+    return HEADER_BYTES + payload + crc16(payload).to_bytes(2, ENDIANNESS)
+
+def report(name: str, func, number: int) -> float:
+    seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"{name:<48} {seconds * 1e6:10.2f} us")
+    return seconds
+
+def bench_crc16() -> None:
+    print("crc16")
+    for label, data in (("16 groups", frame(group_status_data(16), MSGTYPE_GRP_STAT)),
+                        ("4 ACs", frame(ac_status_data(4), MSGTYPE_AC_STAT))):
+        assert crc16_bitwise(data) == crc16(data) == Crc16(data).value
+        view = memoryview(data)
+        old = report(f"  bitwise     ({label}, {len(data)} bytes)", lambda: crc16_bitwise(data), 2000)
+        new = report(f"  table       ({label}, {len(data)} bytes)", lambda: crc16(data), 2000)
+        report(f"  incremental ({label}, {len(data)} bytes)",
+               lambda: Crc16(view[:6]).update(view[6:8]).update(view[8:]).value, 2000)
+        print(f"  speedup: {old / new:.1f}x")
+
+def bench_parser() -> None:
+    print("frame parser")
+    stream = (received_frame(group_status_data(16), MSGTYPE_GRP_STAT) + received_frame(ac_status_data(4), MSGTYPE_AC_STAT)) * 50
+    parser = FrameParser()
+    assert len(parser.feed(stream)) == 100
+    report("  100 frames in one chunk", lambda: parser.feed(stream), 100)
+    chunks = [stream[i:i+64] for i in range(0, len(stream), 64)]
+    def feed_chunks():
+        for chunk in chunks:
+            parser.feed(chunk)
+    report("  100 frames in 64 byte chunks", feed_chunks, 100)
+
+def peak_memory(func, number: int) -> int:
+    tracemalloc.start()
+    for _ in range(number):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def bench_status_records() -> None:
+    print("group status decode (16 groups, alternating frames)")
+    frames = [group_status_data(16), bytes(byte ^ 0x01 if i % 6 == 1 else byte for i, byte in enumerate(group_status_data(16)))]
+    namespaces = decode_groups_namespace(frames[0])
+    records = Message(frames[0], MSGTYPE_GRP_STAT, 1).decode_groups_status()
+    counter = [0]
+
+    def decode_namespace():
+        counter[0] += 1
+        for number, group in decode_groups_namespace(frames[counter[0] % 2]).items():
+            update_namespace(namespaces[number], group.__dict__)
+
+    def decode_into():
+        counter[0] += 1
+        data = frames[counter[0] % 2]
+        for offset in range(0, len(data), AirTouchGroupStatus.CHUNK_SIZE):
+            records[data[offset] & 0b00111111].decode(data, offset)
+
+    report("  namespace decode + update", decode_namespace, 2000)
+    report("  slotted decode into record", decode_into, 2000)
+    print(f"  record size: namespace {sys.getsizeof(namespaces[0]) + sys.getsizeof(namespaces[0].__dict__)} bytes, "
+          f"slotted {sys.getsizeof(records[0])} bytes")
+    for name, func in (("namespace decode + update", decode_namespace), ("slotted decode into record", decode_into)):
+        peak = peak_memory(func, 1000)
+        print(f"  {name:<46} peak traced memory {peak} bytes")
+
+# reply latencies of the simulated console, and the scene applies timed at each
+SCENE_LATENCIES = (0.0, 0.05)
+SCENE_REPEAT = 5
+
+async def time_scene(latency: float) -> None:
+    console = Console(acs=1, groups=16, latency=latency)
+    port = await console.start(port=0)
+    airtouch = AirTouch4("127.0.0.1", port)
+    await asyncio.wait_for(airtouch.ready(), 5)
+
+    async def single(percentage: int) -> None:
+        for group in range(16):
+            await airtouch.request_group_open_perc(group, percentage)
+
+    async def batched(percentage: int) -> None:
+        await airtouch.request_groups([dict(group_number=group, target_type=GROUP_TARGET_TYPES.DAMPER, target=percentage)
+                                       for group in range(16)])
+
+    for name, apply in (("16 awaited commands", single), ("request_groups", batched)):
+        timings = []
+        requests = console.requests
+        for repeat in range(SCENE_REPEAT):
+            # alternate the damper so no command is dropped as a no-op
+            percentage = 30 if repeat % 2 else 60
+            start = time.perf_counter()
+            await apply(percentage)
+            timings.append(time.perf_counter() - start)
+            assert all(group.open_perc == percentage for group in console.groups.values())
+        frames = (console.requests - requests) // SCENE_REPEAT
+        print(f"  {name:<20} latency {latency * 1000:3.0f} ms {frames:2} frames {statistics.median(timings) * 1000:10.2f} ms")
+    await airtouch.disconnect()
+    await console.stop()
+
+def bench_scene() -> None:
+    print("scene apply (16 zones), wall time until the confirming status reply from the simulator")
+    for latency in SCENE_LATENCIES:
+        asyncio.run(time_scene(latency))
+
+def bench_frames() -> None:
+    print("frame building, per command")
+    builder = FrameBuilder()
+    for label, msg in (("group status request", Message.GROUP_STATUS_REQUEST()),
+                       ("group info request", Message.GROUP_EXTENDED_REQUEST()),
+                       ("group control request", Message.GROUP_CONTROL_REQUEST(3, power=1)),
+                       ("16 group control request", Message.GROUPS_CONTROL_REQUEST([dict(group_number=group, power=1) for group in range(16)]))):
+        assert builder.build(msg) == b"".join(encode_concat(msg))
+        for name, func in (("concatenated", lambda: encode_concat(msg)), ("frame builder", lambda: builder.build(msg))):
+            report(f"  {label:<25} {name:<14}", func, 5000)
+            print(f"  {'':<40} peak traced memory {peak_memory(func, 1000)} bytes")
+
+# seconds each timing sample runs for, and the samples per benchmark
+SAMPLE_TIME = 0.02
+SAMPLES = 9
+
+def calls_per_sample(func) -> int:
+    """Number of calls of func that take about SAMPLE_TIME."""
+    number = 1
+    while True:
+        seconds = timeit.timeit(func, number=number)
+        if seconds >= SAMPLE_TIME / 10:
+            return max(1, int(number * SAMPLE_TIME / seconds))
+        number *= 10
+
+def calibrated(func, samples: int = SAMPLES) -> tuple[float, float]:
+    """Returns seconds per call and the time relative to a pure Python calibration loop.
+
+    Every sample of func is paired with a sample of the calibration loop right before it,
+    each running for about SAMPLE_TIME. The medians of the times and of the per-pair ratios
+    are returned, so the relative time does not follow CPU frequency scaling or a busy host,
+    and a single disturbed sample does not move it.
+    """
+    data = bytes(range(16))
+    calibration = lambda: crc16_bitwise(data)
+    calibration_number = calls_per_sample(calibration)
+    number = calls_per_sample(func)
+    timings = []
+    ratios = []
+    for _ in range(samples):
+        reference = timeit.timeit(calibration, number=calibration_number) / calibration_number
+        seconds = timeit.timeit(func, number=number) / number
+        timings.append(seconds)
+        ratios.append(seconds / reference)
+    return statistics.median(timings), statistics.median(ratios)
+
+def codec_suite() -> dict[str, dict[str, float]]:
+    """Time the protocol codec for every payload size, returns the calibrated timings by benchmark name."""
+    print("codec")
+    results = {}
+    builder = FrameBuilder()
+
+    def run(name: str, func) -> None:
+        seconds, relative = calibrated(func)
+        results[name] = {"seconds": seconds, "relative": relative}
+        print(f"  {name:<46} {seconds * 1e6:10.2f} us {relative:8.3f} x calibration")
+
+    for groups in range(1, 17):
+        data = frame(group_status_data(groups), MSGTYPE_GRP_STAT)
+        run(f"crc16 group status ({groups} groups)", lambda: crc16(data))
+    for acs in range(1, 5):
+        data = frame(ac_status_data(acs), MSGTYPE_AC_STAT)
+        run(f"crc16 ac status ({acs} ACs)", lambda: crc16(data))
+    for groups in range(1, 17):
+        msg = Message.GROUPS_CONTROL_REQUEST([dict(group_number=group, power=1) for group in range(groups)])
+        run(f"encode group control ({groups} groups)", lambda: builder.build(msg))
+    for acs in range(1, 5):
+        msg = Message.ACS_CONTROL_REQUEST([dict(unit_number=ac, power=1) for ac in range(acs)])
+        run(f"encode ac control ({acs} ACs)", lambda: builder.build(msg))
+    for groups in range(1, 17):
+        msg = Message(group_status_data(groups), MSGTYPE_GRP_STAT, 1)
+        assert len(msg.decode_groups_status()) == groups
+        run(f"decode_groups_status ({groups} groups)", msg.decode_groups_status)
+    for acs in range(1, 5):
+        msg = Message(ac_status_data(acs), MSGTYPE_AC_STAT, 1)
+        assert len(msg.decode_acs_status()) == acs
+        run(f"decode_acs_status ({acs} ACs)", msg.decode_acs_status)
+    # decode_*_status() times building new records, these time the hub decoding changed chunks into its records
+    for groups in range(1, 17):
+        data = group_status_data(groups)
+        records = Message(data, MSGTYPE_GRP_STAT, 1).decode_groups_status()
+        frames = [data, bytes(byte ^ 0x01 if i % 6 == 1 else byte for i, byte in enumerate(data))]
+        counter = [0]
+
+        def decode_into():
+            counter[0] += 1
+            data = frames[counter[0] % 2]
+            for offset in range(0, len(data), AirTouchGroupStatus.CHUNK_SIZE):
+                records[data[offset] & 0b00111111].decode(data, offset)
+
+        run(f"AirTouchGroupStatus.decode ({groups} groups)", decode_into)
+    for acs in range(1, 5):
+        data = ac_status_data(acs)
+        records = Message(data, MSGTYPE_AC_STAT, 1).decode_acs_status()
+        frames = [data, bytes(byte ^ 0x01 if i % 8 == 2 else byte for i, byte in enumerate(data))]
+        counter = [0]
+
+        def decode_into():
+            counter[0] += 1
+            data = frames[counter[0] % 2]
+            for offset in range(0, len(data), AirTouchACStatus.CHUNK_SIZE):
+                records[data[offset] & 0b00111111].decode(data, offset)
+
+        run(f"AirTouchACStatus.decode ({acs} ACs)", decode_into)
+    for groups in range(1, 17):
+        msg = Message(group_info_data(groups), MSGTYPE_EXTENDED, 1, extended=True)
+        assert len(msg.decode_groups_info()) == groups
+        run(f"decode_groups_info ({groups} groups)", msg.decode_groups_info)
+    for acs in range(1, 5):
+        msg = Message(ac_info_data(acs), MSGTYPE_EXTENDED, 1, extended=True)
+        assert len(msg.decode_acs_info()) == acs
+        run(f"decode_acs_info ({acs} ACs)", msg.decode_acs_info)
+    return results
+
+def compare(results: dict[str, dict[str, float]], baseline: dict[str, dict[str, float]], threshold: float) -> list[str]:
+    """Returns the benchmarks that are more than threshold percent slower than the baseline."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = (result["relative"] / baseline[name]["relative"] - 1) * 100
+        if change > threshold:
+            regressions.append(f"{name}: {baseline[name]['relative']:.3f} -> {result['relative']:.3f} x calibration (+{change:.0f}%)")
+    return regressions
+
+BENCHMARKS = {
+    "crc16": bench_crc16,
+    "parser": bench_parser,
+    "records": bench_status_records,
+    "frames": bench_frames,
+    "scene": bench_scene,
+}
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the AirTouch 4 protocol hot paths.")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help="benchmarks to run: " + ", ".join([*BENCHMARKS, "codec"]) + " (default: all)")
+    parser.add_argument("--save", metavar="PATH", help="save the codec results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare the codec results against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=25.0,
+                        help="percent slowdown against the baseline that fails the run (default: 25)")
+    args = parser.parse_args()
+    selected = args.benchmarks or [*BENCHMARKS, "codec"]
+    for name in selected:
+        if name not in BENCHMARKS and name != "codec":
+            parser.error("unknown benchmark: " + name)
+    if (args.save or args.baseline) and "codec" not in selected:
+        selected.append("codec")
+
+    for name in selected:
+        if name in BENCHMARKS:
+            BENCHMARKS[name]()
+    if "codec" not in selected:
+        return 0
+    results = codec_suite()
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print("baseline saved to " + args.save)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.threshold:g}%:")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print(f"no regressions over {args.threshold:g}% against " + args.baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""Replay an AirTouch 4 capture through the integration's parser and dispatch pipeline.
+
+Record a capture with the polyaire.start_capture service, AirTouch4(host,
+capture_path="airtouch.cap") or airtouch.start_capture(Capture(path)). The received data is served to a fresh hub over a
+local connection, at the recorded pace (--speed scales it) or as fast as
+possible (--fast). The recorded requests are sent again through the hub, and
+the recorded replies re-addressed to the hub's own request ids, so replies and
+pushes are told apart as they were on the console.
+
+Usage: python tools/replay.py airtouch.cap [--speed 1 | --fast] [--profile]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import collections
+import cProfile
+import json
+import logging
+import pstats
+import time
+
+import _polyaire  # noqa: F401
+from polyaire.airtouch4 import AirTouch4
+from polyaire.capture import CAPTURE_RECEIVED, CAPTURE_SENT, read_capture
+from polyaire.protocol import *
+from simulator import RequestParser
+
+class ReplyMatcher:
+    """Rewrites the ids of recorded replies to the ids of the hub's pending requests."""
+    def __init__(self, airtouch: AirTouch4):
+        self._airtouch = airtouch
+        self._parser = RequestParser()
+        # (id, type) of the recorded replies still expected
+        self._recorded = collections.Counter()
+        # hub requests already given a reply the hub has not processed yet
+        self._assigned = set()
+        self.rewritten = 0
+
+    def recorded_sent(self, data: bytes) -> list[Message]:
+        """Track the recorded requests, returns them to be sent again by the hub."""
+        messages = self._parser.feed(data)
+        for msg in messages:
+            self._recorded[(msg.id, msg.reply_type)] += 1
+        return messages
+
+    def _request_id(self, reply_type: int) -> int | None:
+        pending = self._airtouch._pending
+        self._assigned &= pending.keys()
+        for key, (future, _) in pending.items():
+            if key[1] == reply_type and key not in self._assigned and not future.done():
+                self._assigned.add(key)
+                return key[0]
+        return None
+
+    def rewrite(self, chunk: bytes) -> bytes:
+        # only frames complete within the chunk are re-addressed, the rest is replayed as recorded
+        data = bytearray(chunk)
+        index = 0
+        while (index := data.find(HEADER_BYTES, index)) >= 0 and index + FRAME_HEADER_SIZE <= len(data):
+            size = int.from_bytes(data[index + 6:index + 8], ENDIANNESS)
+            end = index + FRAME_HEADER_SIZE + size + FRAME_CRC_SIZE
+            if end > len(data) or crc16(data[index + 2:end - 2]) != int.from_bytes(data[end - 2:end], ENDIANNESS):
+                index += 1
+                continue
+            key = (data[index + 4], data[index + 5])
+            if self._recorded[key] > 0:
+                self._recorded[key] -= 1
+                request_id = self._request_id(key[1])
+                if request_id is not None:
+                    data[index + 4] = request_id
+                    data[end - 2:end] = crc16(data[index + 2:end - 2]).to_bytes(2, ENDIANNESS)
+                    self.rewritten += 1
+            index = end
+        return bytes(data)
+
+class Replay:
+    def __init__(self, path: str, speed: float | None):
+        self.records = list(read_capture(path))
+        self.speed = speed
+        self.airtouch = None
+        self.matcher = None
+        self.done = asyncio.Event()
+        self.received = 0
+        self.duration = None
+
+    @staticmethod
+    def _listener() -> None:
+        pass
+
+    def _send(self, msg: Message) -> None:
+        # recorded requests go through the hub, group status requests through its scheduler
+        if msg.type == MSGTYPE_GRP_STAT:
+            self.airtouch._scheduler.request_group_status()
+        else:
+            self.airtouch._request(Message(msg.data, msg.type, extended=msg.extended))
+
+    def _listen(self) -> None:
+        # a listener on every record, so the dispatcher runs as it does with entities
+        for record in [*self.airtouch.groups.values(), *self.airtouch.acs.values()]:
+            if self._listener not in record.callbacks:
+                record.register_callback(self._listener)
+
+    async def _discard(self, reader: asyncio.StreamReader) -> None:
+        while await reader.read(4096):
+            pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        requests = asyncio.create_task(self._discard(reader))
+        start = time.monotonic()
+        first = self.records[0][1] if self.records else 0
+        for direction, timestamp, data in self.records:
+            if self.speed:
+                delay = start + (timestamp - first) / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if direction == CAPTURE_SENT:
+                for msg in self.matcher.recorded_sent(data):
+                    self._send(msg)
+                continue
+            writer.write(self.matcher.rewrite(data))
+            await writer.drain()
+            # let the hub handle the data before the next record
+            await asyncio.sleep(0)
+            self._listen()
+            self.received += len(data)
+        self.duration = time.monotonic() - start
+        requests.cancel()
+        self.done.set()
+
+    async def run(self) -> AirTouch4:
+        server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.airtouch = AirTouch4("127.0.0.1", server.sockets[0].getsockname()[1])
+        self.matcher = ReplyMatcher(self.airtouch)
+        await self.done.wait()
+        # let the dispatcher run the callbacks of the last frames
+        await asyncio.sleep(0.1)
+        await self.airtouch.disconnect()
+        server.close()
+        return self.airtouch
+
+def report(replay: Replay, airtouch: AirTouch4) -> None:
+    metrics = airtouch.metrics.as_dict()
+    received = sum(1 for direction, _, _ in replay.records if direction == CAPTURE_RECEIVED)
+    print(f"replayed {received} received chunks, {replay.received} bytes in {replay.duration:.3f}s")
+    frames = sum(airtouch.metrics.frames_received.values())
+    print(f"{frames} frames, {frames / replay.duration if replay.duration else 0:.0f} frames/s, "
+          f"{replay.matcher.rewritten} replies matched to the hub's requests")
+    print(json.dumps({key: metrics[key] for key in (
+        "frames_received", "frames_sent", "frames_decoded", "frames_skipped", "crc_errors", "header_errors",
+        "group_status_pushed", "group_status_polled", "group_status_suppressed", "requests_replied")}, indent=2))
+    print("dispatch time: " + json.dumps({key: metrics["dispatch_time"][key] for key in ("count", "mean", "p95", "max")}))
+
+async def main(args: argparse.Namespace) -> None:
+    replay = Replay(args.capture, None if args.fast else args.speed)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    airtouch = await replay.run()
+    if profiler:
+        profiler.disable()
+    report(replay, airtouch)
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="capture file written by a Capture")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed relative to the recording (default: 1)")
+    parser.add_argument("--fast", action="store_true", help="replay as fast as possible")
+    parser.add_argument("--profile", action="store_true", help="profile the replay and print the top functions")
+    parser.add_argument("--verbose", action="store_true", help="log the integration debug messages")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format="%(asctime)s %(name)s %(message)s")
+    asyncio.run(main(args))
@@ -0,0 +1,316 @@
+"""Local AirTouch 4 console simulator.
+
+Speaks the protocol in custom_components/polyaire/protocol.py: answers status,
+extended info and control requests, applies control requests to its simulated
+state, and can push status frames on its own.
+
+Usage: python tools/simulator.py [--acs 1] [--groups 4] [--port 9004] [--push-interval 10] [--latency 0] [--min-gap 0]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+
+import _polyaire  # noqa: F401
+from polyaire.protocol import *
+
+_LOGGER = logging.getLogger("simulator")
+
+# console replies carry the address bytes reversed
+REPLY_ADDRESS_BYTES = bytes(reversed(ADDRESS_BYTES))
+REPLY_EXTENDED_ADDRESS_BYTES = bytes(reversed(EXTENDED_ADDRESS_BYTES))
+# the integration sends the frame length before every frame
+LENGTH_PREFIX_SIZE = 4
+# status frames pushed by the console use message id 0
+PUSH_ID = 0
+
+def encode_temp(temp: float) -> int:
+    return round(temp * 10) + 500
+
+def reply_frame(data: bytes, type: int, id: int, extended: bool = False) -> bytes:
+    address = REPLY_EXTENDED_ADDRESS_BYTES if extended else REPLY_ADDRESS_BYTES
+    payload = address + bytes([id, type]) + len(data).to_bytes(2, ENDIANNESS) + data
+    return HEADER_BYTES + payload + crc16(payload).to_bytes(2, ENDIANNESS)
+
+class RequestParser(FrameParser):
+    """Parses the frames sent to the console, their address bytes are not reversed."""
+    ADDRESS_INDEX = 2
+
+    def _skipped(self, count: int) -> None:
+        if count != LENGTH_PREFIX_SIZE:
+            super()._skipped(count)
+
+class SimulatedGroup:
+    def __init__(self, number: int, name: str, has_sensor: bool = True):
+        self.number = number
+        self.name = name
+        self.power_state = 1
+        self.control_type = 1 if has_sensor else 0
+        self.open_perc = 50
+        self.battery_low = 0
+        self.has_turbo = 0
+        self.target = 22
+        self.has_sensor = int(has_sensor)
+        self.temp = 24.0
+        self.has_spill = 0
+
+    def status(self) -> bytes:
+        temp = encode_temp(self.temp)
+        return bytes([
+            (self.power_state << 6) | self.number,
+            (self.control_type << 7) | self.open_perc,
+            (self.battery_low << 7) | (self.has_turbo << 6) | self.target,
+            self.has_sensor << 7,
+            (temp >> 3) & 0xff,
+            ((temp & 0b111) << 5) | (self.has_spill << 4),
+        ])
+
+    def info(self) -> bytes:
+        return bytes([self.number]) + self.name.encode("utf-8")[:8].ljust(8, b"\x00")
+
+    def control(self, record: bytes) -> None:
+        power_state = record[1] & 0b00000111
+        control_type = (record[1] >> 3) & 0b00000011
+        target_type = (record[1] >> 5) & 0b00000111
+        if power_state == GROUP_POWER_STATES.OFF:
+            self.power_state = 0
+        elif power_state == GROUP_POWER_STATES.ON:
+            self.power_state = 1
+        elif power_state == GROUP_POWER_STATES.TURBO and self.has_turbo:
+            self.power_state = 3
+        elif power_state == GROUP_POWER_STATES.NEXT:
+            self.power_state = 0 if self.power_state else 1
+        if control_type == GROUP_CONTROL_TYPES.DAMPER:
+            self.control_type = 0
+        elif control_type == GROUP_CONTROL_TYPES.TEMPERATURE and self.has_sensor:
+            self.control_type = 1
+        elif control_type == GROUP_CONTROL_TYPES.NEXT and self.has_sensor:
+            self.control_type ^= 1
+        if target_type == GROUP_TARGET_TYPES.DAMPER:
+            self.open_perc = min(record[2], 100)
+        elif target_type == GROUP_TARGET_TYPES.TEMPERATURE:
+            self.target = min(record[2], 0b00111111)
+        elif target_type == GROUP_TARGET_TYPES.INCREMENT:
+            self.open_perc = min(self.open_perc + 5, 100)
+        elif target_type == GROUP_TARGET_TYPES.DECREMENT:
+            self.open_perc = max(self.open_perc - 5, 0)
+
+class SimulatedAC:
+    def __init__(self, number: int, name: str, group_start: int, group_count: int):
+        self.number = number
+        self.name = name
+        self.group_start = group_start
+        self.group_count = group_count
+        self.power_state = 1
+        self.mode = AC_MODES.COOL
+        self.fan_speed = AC_FAN_SPEEDS.AUTO
+        self.spill = 0
+        self.timer = 0
+        self.target = 22
+        self.temp = 24.0
+        self.error_code = 0
+        self.error_info = ""
+        self.min_temp = 16
+        self.max_temp = 30
+        self.modes = 0b00011111
+        self.fan_modes = 0b00011101
+
+    def status(self) -> bytes:
+        temp = encode_temp(self.temp)
+        return bytes([
+            (self.power_state << 6) | self.number,
+            (self.mode << 4) | self.fan_speed,
+            (self.spill << 7) | (self.timer << 6) | self.target,
+            0,
+            (temp >> 3) & 0xff,
+            (temp & 0b111) << 5,
+            self.error_code >> 8,
+            self.error_code & 0xff,
+        ])
+
+    def info(self) -> bytes:
+        return (bytes([self.number, 0]) + self.name.encode("utf-8")[:16].ljust(16, b"\x00")
+                + bytes([self.group_start, self.group_count, self.modes, self.fan_modes, self.min_temp, self.max_temp]))
+
+    def error(self) -> bytes:
+        error_info = self.error_info.encode("utf-8")
+        return MSG_EXTENDED_ERROR_DATA + bytes([self.number, len(error_info)]) + error_info
+
+    def control(self, record: bytes) -> None:
+        power_state = record[0] >> 6
+        mode = record[1] >> 4
+        fan_speed = record[1] & 0b00001111
+        target = record[2] & 0b00111111
+        if power_state == AC_POWER_STATES.OFF:
+            self.power_state = 0
+        elif power_state == AC_POWER_STATES.ON:
+            self.power_state = 1
+        elif power_state == AC_POWER_STATES.NEXT:
+            self.power_state ^= 1
+        if mode != AC_MODES.KEEP:
+            self.mode = mode
+        if fan_speed != AC_FAN_SPEEDS.KEEP:
+            self.fan_speed = fan_speed
+        if target != AC_TARGET_KEEP:
+            self.target = target
+
+class Console:
+    """Simulated console state and TCP server.
+
+    push_interval: seconds between pushed group and AC status frames, None disables pushes
+    latency: seconds to wait before each reply
+    drift: degrees the temperatures move towards their targets on every push
+    min_gap: seconds after a request during which further requests are dropped, like a busy console
+    """
+    def __init__(self, acs: int = 1, groups: int = 4, push_interval: float | None = None,
+                 latency: float = 0.0, drift: float = 0.0, min_gap: float = 0.0):
+        self.groups = {number: SimulatedGroup(number, "Zone " + str(number)) for number in range(groups)}
+        per_ac = max(1, groups // max(1, acs))
+        self.acs = {}
+        for number in range(acs):
+            start = min(number * per_ac, max(groups - 1, 0))
+            count = groups - start if number == acs - 1 else per_ac
+            self.acs[number] = SimulatedAC(number, "AC " + str(number), start, count)
+        self.push_interval = push_interval
+        self.latency = latency
+        self.drift = drift
+        self.min_gap = min_gap
+        self.requests = 0
+        self.dropped = 0
+        self._last_request = None
+        self._server = None
+        self._writers = set()
+        self._handlers = set()
+
+    def groups_status(self) -> bytes:
+        return b"".join(group.status() for group in self.groups.values())
+
+    def acs_status(self) -> bytes:
+        return b"".join(ac.status() for ac in self.acs.values())
+
+    def groups_info(self) -> bytes:
+        return MSG_EXTENDED_GROUP_DATA + b"".join(group.info() for group in self.groups.values())
+
+    def acs_info(self) -> bytes:
+        return MSG_EXTENDED_AC_DATA + b"".join(ac.info() for ac in self.acs.values())
+
+    def reply(self, msg: Message) -> bytes | None:
+        self.requests += 1
+        if msg.type == MSGTYPE_GRP_CTRL:
+            for offset in range(0, len(msg.data) - 3, 4):
+                group = self.groups.get(msg.data[offset])
+                if group:
+                    group.control(msg.data[offset:offset + 4])
+            return reply_frame(self.groups_status(), MSGTYPE_GRP_STAT, msg.id)
+        if msg.type == MSGTYPE_GRP_STAT:
+            return reply_frame(self.groups_status(), MSGTYPE_GRP_STAT, msg.id)
+        if msg.type == MSGTYPE_AC_CTRL:
+            for offset in range(0, len(msg.data) - 3, 4):
+                ac = self.acs.get(msg.data[offset] & 0b00111111)
+                if ac:
+                    ac.control(msg.data[offset:offset + 4])
+            return reply_frame(self.acs_status(), MSGTYPE_AC_STAT, msg.id)
+        if msg.type == MSGTYPE_AC_STAT:
+            return reply_frame(self.acs_status(), MSGTYPE_AC_STAT, msg.id)
+        if msg.type == MSGTYPE_EXTENDED:
+            if msg.data[:2] == MSG_EXTENDED_GROUP_DATA:
+                return reply_frame(self.groups_info(), MSGTYPE_EXTENDED, msg.id, extended=True)
+            if msg.data[:2] == MSG_EXTENDED_AC_DATA:
+                return reply_frame(self.acs_info(), MSGTYPE_EXTENDED, msg.id, extended=True)
+            if msg.data[:2] == MSG_EXTENDED_ERROR_DATA and msg.data[2] in self.acs:
+                return reply_frame(self.acs[msg.data[2]].error(), MSGTYPE_EXTENDED, msg.id, extended=True)
+        _LOGGER.warning("Unsupported request with type: " + hex(msg.type))
+        return None
+
+    def _drift(self) -> None:
+        for group in self.groups.values():
+            if group.power_state and group.has_sensor and group.temp != group.target:
+                step = min(self.drift, abs(group.target - group.temp))
+                group.temp = round(group.temp + (step if group.target > group.temp else -step), 1)
+
+    def push(self) -> None:
+        """Send group and AC status to all connected clients."""
+        if self.drift:
+            self._drift()
+        frames = reply_frame(self.groups_status(), MSGTYPE_GRP_STAT, PUSH_ID) + reply_frame(self.acs_status(), MSGTYPE_AC_STAT, PUSH_ID)
+        for writer in self._writers:
+            writer.write(frames)
+
+    async def _pusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.push_interval)
+            self.push()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        _LOGGER.info("Client connected: " + str(writer.get_extra_info("peername")))
+        parser = RequestParser()
+        self._writers.add(writer)
+        self._handlers.add(asyncio.current_task())
+        pusher = asyncio.create_task(self._pusher()) if self.push_interval else None
+        try:
+            while data := await reader.read(4096):
+                for msg in parser.feed(data):
+                    now = time.monotonic()
+                    if self.min_gap and self._last_request is not None and now - self._last_request < self.min_gap:
+                        self.dropped += 1
+                        continue
+                    self._last_request = now
+                    frame = self.reply(msg)
+                    if frame is None:
+                        continue
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    writer.write(frame)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if pusher:
+                pusher.cancel()
+            self._writers.discard(writer)
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+            _LOGGER.info("Client disconnected")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 9004) -> int:
+        """Start listening, returns the port (useful with port 0)."""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        """Stop listening and drop all clients, e.g. to simulate a console reboot."""
+        if self._server:
+            self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        # let the client handlers see the closed connections and finish
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=1)
+        if self._server:
+            await self._server.wait_closed()
+            self._server = None
+
+async def main(args: argparse.Namespace) -> None:
+    console = Console(args.acs, args.groups, args.push_interval, args.latency, args.drift, args.min_gap)
+    port = await console.start(args.host, args.port)
+    _LOGGER.info("AirTouch 4 simulator listening on " + args.host + ":" + str(port))
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9004)
+    parser.add_argument("--acs", type=int, default=1, help="number of ACs (1-4)")
+    parser.add_argument("--groups", type=int, default=4, help="number of groups (1-16)")
+    parser.add_argument("--push-interval", type=float, default=None, help="seconds between pushed status frames")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each reply")
+    parser.add_argument("--drift", type=float, default=0.0, help="degrees the temperatures move on every push")
+    parser.add_argument("--min-gap", type=float, default=0.0, help="seconds after a request during which further requests are dropped")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass